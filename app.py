@@ -1,44 +1,76 @@
+import base64
 from pathlib import Path
 
 from htmltools import head_content
-from shiny import App, reactive, render, ui
+from shiny import App, reactive, render, req, ui
 from shinywidgets import output_widget, render_widget
+from starlette.routing import Route
 
+import chart_data
+import chart_registry
+import dataset_store
+import endpoints
+import instrumentation
+import kpi_table
 import metrics_box
 import prefecture_dictionary
 import plot_figure
+import plot_backend
 import plot_func
+import positivity
+import prerender
+import refresher
+import render_queue
+import spec_cache
+import time_index
+import tracing
+import weekly_detail
 
-CSV_URL = "https://covid19.mhlw.go.jp/public/opendata/newly_confirmed_cases_daily.csv"
 pref = prefecture_dictionary.create_pref_dict()
 
 
-def col_plot_block(title: str, plot_id: str, radio_id: str = ""):
+def range_inputs(radio_id: str):
+    return (ui.input_radio_buttons(
+                radio_id,
+                "グラフ表示期間",
+                {
+                    "week": "1週間",
+                    "month": "1か月",
+                    "3months": "3か月",
+                    "year": "1年",
+                    time_index.CUSTOM: "期間指定"
+                },
+                selected="year"
+            ),
+            ui.panel_conditional(
+                f"input.{radio_id} === '{time_index.CUSTOM}'",
+                ui.input_date_range(f"{radio_id}_dates", "",
+                                    language="ja", separator="〜")
+            ))
+
+
+def col_plot_block(title: str, plot_id: str, radio_id: str = "",
+                   below: tuple = ()):
+    # below: more of the column, under the plot
     if radio_id:
         block = ui.column(4,
                           ui.markdown(f"#### {title}"),
-                          ui.input_radio_buttons(
-                              radio_id,
-                              "グラフ表示期間",
-                              {
-                                  "week": "1週間",
-                                  "month": "1か月",
-                                  "3months": "3か月",
-                                  "year": "1年"
-                              },
-                              selected="year"
-                          ),
-                          output_widget(plot_id)),
+                          *range_inputs(radio_id),
+                          output_widget(plot_id),
+                          *below),
     else:
         block = ui.column(4,
                           ui.markdown(f"#### {title}"),
-                          output_widget(plot_id)),
+                          output_widget(plot_id),
+                          *below),
     return block
 
 
 def tab1_contents():
     contents = ui.row(
-        col_plot_block("新規陽性者数の推移(日別)", "plot1_1", "rb1"),
+        col_plot_block("新規陽性者数の推移(日別)", "plot1_1", "rb1",
+                       (ui.markdown("#### 全国と選択した都道府県の新規陽性者数"),
+                        ui.output_ui("my_plot"))),
         col_plot_block("人口10万人当たり新規陽性者数", "plot1_2", "rb2"),
         col_plot_block("性別・年代別新規陽性者数(週別)", "plot1_3")
     )
@@ -54,6 +86,32 @@ def tab2_contents():
     return contents
 
 
+def tab3_contents():
+    contents = ui.row(
+        ui.column(3,
+                  ui.input_selectize(
+                      "compare_prefs",
+                      "比較する都道府県(未選択なら全都道府県)",
+                      list(pref.keys())[1:],
+                      multiple=True
+                  ),
+                  ui.input_radio_buttons(
+                      "compare_metric",
+                      "指標",
+                      {
+                          "weekly_per_100k": "直近1週間の人口10万人当たり新規陽性者数",
+                          "week_over_week": "新規陽性者数の前週比"
+                      },
+                      selected="weekly_per_100k"
+                  ),
+                  *range_inputs("rb3")),
+        ui.column(9,
+                  ui.markdown("#### 都道府県別の比較"),
+                  output_widget("plot3_1"))
+    )
+    return contents
+
+
 app_ui = ui.page_fluid(
     # head
     head_content(
@@ -71,12 +129,20 @@ app_ui = ui.page_fluid(
             ui.markdown("----"),
             ui.output_ui("metricsCards"),
             ui.markdown("---"),
-            tab1_contents()
+            tab1_contents(),
+            value="trend"
         ),
         ui.nav(
             "レベルの判断で参考とされる指標関連データ",
-            tab2_contents()
+            tab2_contents(),
+            value="indicators"
+        ),
+        ui.nav(
+            "都道府県比較",
+            tab3_contents(),
+            value="compare"
         ),
+        id="tab",
         header=ui.input_select(
             id="prefecture",
             label="都道府県ごとに閲覧できます。",
@@ -86,109 +152,262 @@ app_ui = ui.page_fluid(
 )
 
 
+def daily_view(name: str, url: str, prefecture, plot_range, metric: str = None):
+    # typed dataset -> prefecture series -> date range view; each layer is
+    # cached, so e.g. a range change only re-slices the series
+    @reactive.Calc
+    @tracing.traced(f"{name}.raw")
+    def raw():
+        refresher.dataset_version(url)
+        return plot_figure.daily_frame(url, metric)
+
+    @reactive.Calc
+    @tracing.traced(f"{name}.series")
+    def series():
+        return plot_figure.prefecture_series(raw(), prefecture())
+
+    @reactive.Calc
+    @tracing.traced(f"{name}.view")
+    def view():
+        params = plot_range()
+        return plot_figure.filter_df_with_daterange(
+            series(), params["range"], params.get("start"), params.get("end"))
+
+    return view
+
+
+def range_params(choice, dates):
+    # a chart's range as spec cache params: the preset picked, or the dates
+    # picked for time_index.CUSTOM
+    @reactive.Calc
+    def params():
+        if choice() != time_index.CUSTOM:
+            return {"range": choice()}
+        start, end = dates()
+        bounds = {"start": start, "end": end}
+        return {"range": time_index.CUSTOM,
+                **{k: v.isoformat() for k, v in bounds.items() if v is not None}}
+
+    return params
+
+
+def date_picker(input_id: str, dates):
+    # keeps the 期間指定 picker within the loaded days: it starts on the last
+    # 3 months, and moves along with the data until the user picks dates
+    seeded = reactive.Value(None)
+
+    @reactive.Effect
+    def _():
+        refresher.dataset_version(endpoints.NEWLY_CONFIRMED_DAILY)
+        bounds = time_index.picker_bounds(time_index.dates(
+            dataset_store.read(endpoints.NEWLY_CONFIRMED_DAILY)))
+        req(bounds)
+        with reactive.isolate():
+            previous = seeded()
+            picked = tuple(dates()) if previous is not None and dates.is_set() else None
+        if previous is not None and picked != previous:
+            bounds = {"min": bounds["min"], "max": bounds["max"]}
+        else:
+            seeded.set((bounds["start"], bounds["end"]))
+        ui.update_date_range(input_id, **bounds)
+
+
 def server(input, output, session):
+    tracing.trace_inputs(input, ["prefecture", "rb1", "rb2", "rb1_dates",
+                                 "rb2_dates", "compare_prefs", "compare_metric",
+                                 "rb3", "rb3_dates"])
+    instrumentation.track_session(session)
+    renders = render_queue.SessionRenders(session)
+
+    # a burst of changes to an input renders only the value it ends on
+    selected = render_queue.debounce(input.prefecture)
+    rb1 = range_params(render_queue.debounce(input.rb1),
+                       render_queue.debounce(input.rb1_dates))
+    rb2 = range_params(render_queue.debounce(input.rb2),
+                       render_queue.debounce(input.rb2_dates))
+    date_picker("rb1_dates", input.rb1_dates)
+    date_picker("rb2_dates", input.rb2_dates)
+
+    @reactive.Calc
+    def prefecture():
+        return pref[selected()][0]
+
+    compared = render_queue.debounce(input.compare_prefs)
+    rb3 = range_params(render_queue.debounce(input.rb3),
+                       render_queue.debounce(input.rb3_dates))
+    date_picker("rb3_dates", input.rb3_dates)
+
+    new_cases_style = chart_registry.NEW_CASES_STYLES["new_cases"]
+    new_cases_100k_style = chart_registry.NEW_CASES_STYLES["new_cases_100k"]
+    new_cases = daily_view("new_cases", new_cases_style["url"],
+                           prefecture, rb1)
+    new_cases_100k = daily_view("new_cases_100k", new_cases_100k_style["url"],
+                                prefecture, rb2, new_cases_100k_style["metric"])
+
     @output
     @render.ui
-    @reactive.event(input.prefecture)
+    @instrumentation.rendered("metricsCards")
+    @tracing.traced("metricsCards")
     def metricsCards():
-        prefecID = pref[input.prefecture()]
-        # metrics
-        metrics1_1, metrics1_2 = metrics_box.metrics_get_diff(pref=prefecID[0])
-        metrics2 = metrics_box.metrics_cumulative_newly_cases(pref=prefecID[0])
-        metrics3_1, metrics3_2 = metrics_box.metrics_get_diff(
-            pref=prefecID[0],
-            url="https://covid19.mhlw.go.jp/public/opendata/severe_cases_daily.csv"
-        )
-        metrics4_1, metrics4_2 = metrics_box.death_cases_cumulative(
-            pref=prefecID[0],
-            url="https://covid19.mhlw.go.jp/public/opendata/deaths_cumulative_daily.csv"
-        )
-
-        tags = ui.div(
-            ui.div(
-                metrics_box.metrics_card_item(
-                    str_title="新規の陽性者数",
-                    num_main=metrics1_1,
-                    num_sub=metrics1_2),
-                metrics_box.metrics_card_item(
-                    str_title="陽性者の累積",
-                    num_main=metrics2),
-                metrics_box.metrics_card_item(
-                    str_title="現在の重症者数",
-                    num_main=metrics3_1,
-                    num_sub=metrics3_2),
-                metrics_box.metrics_card_item(
-                    str_title="死亡者の累積",
-                    num_main=metrics4_1,
-                    num_sub=metrics4_2),
-                class_="col4-pattern1_left"
-            ),
-            class_="col4-pattern1"
-        )
-        return tags
+        refresher.dataset_version(*kpi_table.SOURCES)
+        html = prerender.load_card(prefecture())
+        if html is not None:
+            return ui.HTML(html)
+        return metrics_box.metrics_cards(prefecture())
 
     @output
-    @render.plot
+    @render.ui
+    @instrumentation.rendered("my_plot")
     def my_plot():
-        plot = plot_func.plot_line_cases(
-            url="https://covid19.mhlw.go.jp/public/opendata/newly_confirmed_cases_daily.csv",
-            prefec=pref[input.prefecture()][0],
-            period=input.rb1()
+        # drawn with matplotlib in plot_backend's pool, cached per data version
+        version = refresher.dataset_version(endpoints.NEWLY_CONFIRMED_DAILY)
+        params = rb1()
+        data = plot_func.line_cases_data(
+            url=endpoints.NEWLY_CONFIRMED_DAILY,
+            prefec=prefecture(),
+            period=params["range"],
+            start=params.get("start"),
+            end=params.get("end")
         )
-        return plot
+        png = renders.image(
+            "my_plot",
+            ("line_cases", prefecture(), tuple(sorted(params.items())), version),
+            plot_func.line_cases_figure, (data, prefecture()))
+        return ui.tags.img(
+            src=f"data:image/png;base64,{base64.b64encode(png).decode()}",
+            style="max-width: 100%;")
 
     @output
     @render_widget
+    @instrumentation.rendered("plot1_1")
+    @tracing.traced("plot1_1")
     def plot1_1():
-        return plot_figure.plot_new_cases(
-            url="https://covid19.mhlw.go.jp/public/opendata/newly_confirmed_cases_daily.csv",
-            plot_range=input.rb1(),
-            ytick_space=50000,
-            color="#fd6262",
-            prefecture=pref[input.prefecture()][0]
+        refresher.dataset_version(endpoints.NEWLY_CONFIRMED_DAILY)
+        view = new_cases()
+        return renders.widget(
+            "plot1_1", "new_cases",
+            {"prefecture": prefecture(), **rb1()},
+            lambda: plot_figure.new_cases_chart(
+                view,
+                ytick_space=new_cases_style["ytick_space"],
+                color=new_cases_style["color"],
+                prefecture=prefecture()
+            )
         )
 
     @output
     @render_widget
+    @instrumentation.rendered("plot1_2")
+    @tracing.traced("plot1_2")
     def plot1_2():
-        return plot_figure.plot_new_cases(
-            url="https://covid19.mhlw.go.jp/public/opendata/newly_confirmed_cases_per_100_thousand_population_daily.csv",
-            plot_range=input.rb2(),
-            ytick_space=40,
-            color="#a1b8e8",
-            prefecture=pref[input.prefecture()][0]
+        refresher.dataset_version(endpoints.NEWLY_CONFIRMED_DAILY)
+        view = new_cases_100k()
+        return renders.widget(
+            "plot1_2", "new_cases_100k",
+            {"prefecture": prefecture(), **rb2()},
+            lambda: plot_figure.new_cases_chart(
+                view,
+                ytick_space=new_cases_100k_style["ytick_space"],
+                color=new_cases_100k_style["color"],
+                prefecture=prefecture()
+            )
         )
 
     @output
     @render_widget
+    @instrumentation.rendered("plot1_3")
+    @tracing.traced("plot1_3")
     def plot1_3():
-        return plot_figure.plot_generation_severe_cases(
-            url="https://covid19.mhlw.go.jp/public/opendata/newly_confirmed_cases_detail_weekly.csv",
-            prefec_order=pref[input.prefecture()][1]
+        refresher.dataset_version(endpoints.NEWLY_CONFIRMED_DETAIL_WEEKLY)
+        prefec_order = pref[selected()][1]
+        return renders.widget(
+            "plot1_3", "generation_severe_cases",
+            {"prefec_order": prefec_order},
+            lambda: plot_figure.plot_generation_severe_cases(
+                url=endpoints.NEWLY_CONFIRMED_DETAIL_WEEKLY,
+                prefec_order=prefec_order
+            )
         )
 
     @output
     @render_widget
+    @instrumentation.rendered("plot2_1")
+    @tracing.traced("plot2_1")
     def plot2_1():
-        return plot_figure.plot_newly_cases_stack(
-            url="https://covid19.mhlw.go.jp/public/opendata/newly_confirmed_cases_detail_weekly.csv",
-            pref_n=pref[input.prefecture()][1]
+        refresher.dataset_version(endpoints.NEWLY_CONFIRMED_DETAIL_WEEKLY)
+        pref_n = pref[selected()][1]
+        return renders.widget(
+            "plot2_1", "newly_cases_stack",
+            {"pref_n": pref_n},
+            lambda: plot_figure.plot_newly_cases_stack(
+                url=endpoints.NEWLY_CONFIRMED_DETAIL_WEEKLY,
+                pref_n=pref_n
+            )
         )
 
     @output
     @render_widget
+    @instrumentation.rendered("plot2_2")
+    @tracing.traced("plot2_2")
     def plot2_2():
-        return plot_figure.plot_pcr_org(
-            url="https://www.mhlw.go.jp/content/pcr_case_daily.csv"
+        # no session input: after the first session of a data version this
+        # is a cache lookup, sent to every session as the same JSON
+        refresher.dataset_version(endpoints.PCR_CASE)
+        return renders.widget(
+            "plot2_2", "pcr_org",
+            {},
+            lambda: plot_figure.plot_pcr_org(
+                url=endpoints.PCR_CASE
+            )
         )
 
     @output
     @render_widget
+    @instrumentation.rendered("plot2_3")
+    @tracing.traced("plot2_3")
     def plot2_3():
-        return plot_figure.plot_positive_rate(
-            url_pcr="https://www.mhlw.go.jp/content/pcr_tested_daily.csv",
-            url_detected="https://covid19.mhlw.go.jp/public/opendata/newly_confirmed_cases_daily.csv"
+        refresher.dataset_version(endpoints.PCR_TESTED,
+                                  endpoints.NEWLY_CONFIRMED_DAILY)
+        return renders.widget(
+            "plot2_3", "positive_rate",
+            {},
+            lambda: plot_figure.plot_positive_rate(
+                url_pcr=endpoints.PCR_TESTED,
+                url_detected=endpoints.NEWLY_CONFIRMED_DAILY
+            )
+        )
+
+    @output
+    @render_widget
+    @instrumentation.rendered("plot3_1")
+    @tracing.traced("plot3_1")
+    def plot3_1():
+        refresher.dataset_version(endpoints.NEWLY_CONFIRMED_DAILY)
+        # in the dictionary's order, so every session picking the same
+        # prefectures shares one spec
+        chosen = sorted(compared() or (), key=lambda ja: pref[ja][1])
+        params = {"prefectures": ",".join(pref[ja][0] for ja in chosen) or "all",
+                  "metric": input.compare_metric(), **rb3()}
+        return renders.widget(
+            "plot3_1", "comparison",
+            params,
+            lambda: chart_registry.build("comparison", params)
         )
 
 
 app = App(app_ui, server)
+refresher.on_refresh(kpi_table.get_table)
+refresher.on_refresh(weekly_detail.get_cube)
+refresher.on_refresh(positivity.get_engine)
+refresher.on_refresh(chart_data.prune)
+chart_data.fallbacks.append(prerender.data_dir)
+instrumentation.add_collector(dataset_store.store.collect_metrics)
+instrumentation.add_collector(spec_cache.collect_metrics)
+# ahead of shiny's catch-all static mount
+app.starlette_app.router.routes.insert(
+    0, Route("/metrics", instrumentation.metrics_endpoint))
+app.starlette_app.router.routes.insert(
+    0, Route(f"/{chart_data.URL_PREFIX}/{{name}}", chart_data.endpoint))
+app.starlette_app.add_event_handler("startup", refresher.start)
+app.starlette_app.add_event_handler("shutdown", refresher.stop)
+app.starlette_app.add_event_handler("shutdown", plot_backend.shutdown)
@@ -0,0 +1,39 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+
+
+def compare(old: dict, new: dict, threshold: float) -> list:
+    # (name, old median, new median, ratio, regressed) for every shared benchmark
+    rows = []
+    for name, stats in new["results"].items():
+        if name not in old["results"]:
+            continue
+        before, after = old["results"][name]["median_ms"], stats["median_ms"]
+        ratio = after / before if before else float("inf")
+        rows.append((name, before, after, ratio, ratio > threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="compare two benchmark results")
+    parser.add_argument("old", type=Path)
+    parser.add_argument("new", type=Path)
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="new/old median ratio reported as a regression")
+    args = parser.parse_args()
+    old = json.loads(args.old.read_text())
+    new = json.loads(args.new.read_text())
+
+    print(f"{old['meta']['commit']} -> {new['meta']['commit']}")
+    rows = compare(old, new, args.threshold)
+    width = max((len(row[0]) for row in rows), default=0)
+    for name, before, after, ratio, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<{width}}  {before:10.2f} -> {after:10.2f} ms  x{ratio:.2f}{flag}")
+    sys.exit(1 if any(row[4] for row in rows) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import websockets
+
+import prefecture_dictionary
+from benchmarks import standin, synthetic
+from benchmarks.run import RESULTS_DIR, _git
+
+ROOT = Path(__file__).parent.parent
+TABS = {
+    "trend": ["metricsCards", "plot1_1", "my_plot", "plot1_2", "plot1_3"],
+    "indicators": ["plot2_1", "plot2_2", "plot2_3"],
+    "compare": ["plot3_1"],
+}
+# the inputs each output is rendered from; an output that is visible and
+# was last rendered with other values is expected to arrive again
+DEPENDS = {
+    "metricsCards": ["prefecture"],
+    "plot1_1": ["prefecture", "rb1"],
+    "my_plot": ["prefecture", "rb1"],
+    "plot1_2": ["prefecture", "rb2"],
+    "plot1_3": ["prefecture"],
+    "plot2_1": ["prefecture"],
+    "plot2_2": [],
+    "plot2_3": [],
+    "plot3_1": ["compare_prefs", "compare_metric", "rb3"],
+}
+RANGES = ["week", "month", "3months", "year"]
+COMPARE_METRICS = ["weekly_per_100k", "week_over_week"]
+# relative frequency of each interaction after connecting
+ACTIONS = {"prefecture": 5, "rb1": 2, "rb2": 2, "tab": 1, "compare_prefs": 2,
+           "compare_metric": 1, "rb3": 2}
+# the tab an interaction's control is on; the others are in the header
+ON_TAB = {"rb1": "trend", "rb2": "trend", "compare_prefs": "compare",
+          "compare_metric": "compare", "rb3": "compare"}
+
+
+def _hidden(tab: str) -> dict:
+    # what the browser reports when the tab is shown: outputs on other tabs
+    # are hidden, so the server suspends them
+    return {f".clientdata_output_{output}_hidden": output not in TABS[tab]
+            for outputs in TABS.values() for output in outputs}
+
+
+class Session:
+    # one scripted user: connects, then picks interactions at random with a
+    # think time between them, and records how long each expected output
+    # takes to arrive
+    def __init__(self, url: str, prefectures: list, rng: random.Random,
+                 timeout: float):
+        self.url = url
+        self.prefectures = prefectures
+        self.rng = rng
+        self.timeout = timeout
+        # what the browser sends on connect; an empty selectize is null
+        self.inputs = {"prefecture": rng.choice(prefectures), "rb1": "year",
+                       "rb2": "year", "tab": "trend", "compare_prefs": None,
+                       "compare_metric": COMPARE_METRICS[0], "rb3": "year"}
+        self.shown: dict = {}
+        # (output, seconds) for every output that arrived, and the ones that
+        # didn't within the timeout
+        self.timings: list = []
+        self.timeouts: list = []
+        self.errors = 0
+        self.actions = 0
+
+    def _expected(self) -> set:
+        return {output for output in TABS[self.inputs["tab"]]
+                if self.shown.get(output) != self._state(output)}
+
+    def _state(self, output: str) -> tuple:
+        return tuple(self.inputs[name] for name in DEPENDS[output])
+
+    def _next_action(self) -> dict:
+        tab = self.inputs["tab"]
+        actions = [a for a in ACTIONS if ON_TAB.get(a, tab) == tab]
+        action = self.rng.choices(actions, [ACTIONS[a] for a in actions])[0]
+        if action == "prefecture":
+            choices = [p for p in self.prefectures if p != self.inputs["prefecture"]]
+            return {"prefecture": self.rng.choice(choices)}
+        if action == "tab":
+            tab = self.rng.choice([t for t in TABS if t != tab])
+            return {"tab": tab, **_hidden(tab)}
+        if action == "compare_prefs":
+            # all of them (none selected) or a handful, "全国" isn't offered
+            picks = self.inputs["compare_prefs"]
+            while picks == self.inputs["compare_prefs"]:
+                picks = self.rng.sample(self.prefectures[1:],
+                                        self.rng.choice([0, 2, 5, 10])) or None
+            return {"compare_prefs": picks}
+        if action == "compare_metric":
+            return {"compare_metric": self.rng.choice(
+                [m for m in COMPARE_METRICS if m != self.inputs["compare_metric"]])}
+        return {action: self.rng.choice([r for r in RANGES if r != self.inputs[action]])}
+
+    async def _wait(self, ws, start: float):
+        expected = self._expected()
+        deadline = start + self.timeout
+        while expected:
+            try:
+                message = json.loads(await asyncio.wait_for(
+                    ws.recv(), max(deadline - time.perf_counter(), 0)))
+            except asyncio.TimeoutError:
+                break
+            self.errors += len(message.get("errors") or {})
+            for output, value in (message.get("values") or {}).items():
+                if output in expected:
+                    self.timings.append((output, time.perf_counter() - start))
+                    self.shown[output] = self._state(output)
+                    expected.discard(output)
+        self.timeouts += list(expected)
+        # whatever was left unanswered counts as rendered, so the next action
+        # doesn't wait for it again
+        for output in expected:
+            self.shown[output] = self._state(output)
+
+    async def run(self, actions: int, think: float):
+        async with websockets.connect(self.url, max_size=None) as ws:
+            start = time.perf_counter()
+            await ws.send(json.dumps({"method": "init", "data": {
+                **self.inputs, **_hidden(self.inputs["tab"])}}))
+            await self._wait(ws, start)
+            for _ in range(actions):
+                await asyncio.sleep(self.rng.expovariate(1 / think) if think else 0)
+                update = self._next_action()
+                self.inputs.update({k: v for k, v in update.items()
+                                    if not k.startswith(".")})
+                start = time.perf_counter()
+                await ws.send(json.dumps({"method": "update", "data": update}))
+                self.actions += 1
+                await self._wait(ws, start)
+
+
+def _processes(root_pid: int) -> list:
+    # the server and every process below it: uvicorn's workers and the
+    # plot pools they spawn
+    children: dict = {}
+    for stat in Path("/proc").glob("[0-9]*/stat"):
+        try:
+            fields = stat.read_text().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(stat.parent.name))
+    pids, queue = [], [root_pid]
+    while queue:
+        pid = queue.pop()
+        pids.append(pid)
+        queue += children.get(pid, [])
+    return pids
+
+
+def _usage(pids: list) -> tuple:
+    # (CPU seconds, RSS bytes) summed over the processes still alive
+    cpu = rss = 0
+    for pid in pids:
+        try:
+            fields = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+            status = Path(f"/proc/{pid}/status").read_text()
+        except OSError:
+            continue
+        cpu += (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        rss += int(status.split("VmRSS:")[1].split()[0]) * 1024
+    return cpu, rss
+
+
+async def sample(pid: int, interval: float, samples: list):
+    # CPU use and RSS of the server's processes over time, every interval
+    if not Path(f"/proc/{pid}").exists():
+        return
+    start = time.perf_counter()
+    last_cpu, last_time = _usage(_processes(pid))[0], start
+    while True:
+        await asyncio.sleep(interval)
+        pids = _processes(pid)
+        cpu, rss = _usage(pids)
+        now = time.perf_counter()
+        samples.append({"t": round(now - start, 2),
+                        "cpu_percent": round((cpu - last_cpu) * 100 / (now - last_time), 1),
+                        "rss_mb": round(rss / 2**20, 1),
+                        "processes": len(pids)})
+        last_cpu, last_time = cpu, now
+
+
+def percentiles(seconds: list) -> dict:
+    ms = np.array(seconds) * 1000
+    return {"count": len(ms),
+            "p50_ms": float(np.percentile(ms, 50)),
+            "p95_ms": float(np.percentile(ms, 95)),
+            "p99_ms": float(np.percentile(ms, 99)),
+            "max_ms": float(ms.max())}
+
+
+async def load(url: str, sessions: int, actions: int, think: float, ramp: float,
+               timeout: float, seed: int, pid: int = None,
+               interval: float = 1) -> dict:
+    prefectures = list(prefecture_dictionary.create_pref_dict())
+    rng = random.Random(seed)
+    users = [Session(url, prefectures, random.Random(rng.random()), timeout)
+             for _ in range(sessions)]
+
+    async def start(i: int, user: Session):
+        # arrivals spread over the ramp
+        await asyncio.sleep(ramp * i / sessions)
+        try:
+            await user.run(actions, think)
+        except (OSError, websockets.WebSocketException):
+            user.errors += 1
+
+    samples: list = []
+    sampler = asyncio.create_task(sample(pid, interval, samples)) if pid else None
+    began = time.perf_counter()
+    await asyncio.gather(*(start(i, user) for i, user in enumerate(users)))
+    elapsed = time.perf_counter() - began
+    if sampler is not None:
+        sampler.cancel()
+
+    by_output: dict = {}
+    for user in users:
+        for output, seconds in user.timings:
+            by_output.setdefault(output, []).append(seconds)
+    timeouts = [output for user in users for output in user.timeouts]
+    outputs = {output: {**percentiles(seconds), "timeouts": timeouts.count(output)}
+               for output, seconds in sorted(by_output.items())}
+    return {
+        "seconds": elapsed,
+        "actions": sum(user.actions for user in users),
+        "throughput": {
+            "actions_per_s": sum(user.actions for user in users) / elapsed,
+            "outputs_per_s": sum(len(user.timings) for user in users) / elapsed,
+        },
+        "errors": sum(user.errors for user in users),
+        "timeouts": len(timeouts),
+        "outputs": outputs,
+        "resources": samples,
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_app(env: dict, workers: int) -> tuple:
+    # the app under uvicorn, as deployed; returns (process, base URL) once it
+    # answers
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port),
+         "--workers", str(workers)],
+        cwd=ROOT, env={**os.environ, **env},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(600):
+        try:
+            urllib.request.urlopen(base + "/", timeout=1)
+            return process, base
+        except OSError:
+            if process.poll() is not None:
+                raise RuntimeError("the app exited while starting")
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("the app didn't start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="concurrent sessions against "
+                                                 "the dashboard over websockets")
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--actions", type=int, default=10,
+                        help="interactions per session after connecting")
+    parser.add_argument("--think", type=float, default=2,
+                        help="mean seconds between a session's interactions")
+    parser.add_argument("--ramp", type=float, default=10,
+                        help="seconds over which the sessions connect")
+    parser.add_argument("--timeout", type=float, default=30,
+                        help="seconds to wait for the outputs of an interaction")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--url", help="an instance that is already running, "
+                                      "e.g. http://127.0.0.1:8000")
+    parser.add_argument("--pid", type=int,
+                        help="its server process, for CPU and RSS sampling")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--days", type=int, default=1000,
+                        help="length of the generated history")
+    parser.add_argument("--latency", type=float, default=0,
+                        help="seconds the stand-in adds to every response")
+    parser.add_argument("--output", type=Path,
+                        help=f"result file, default {RESULTS_DIR}/load-<time>-<commit>.json")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        process = server = None
+        base, pid = args.url, args.pid
+        if base is None:
+            synthetic.generate(Path(root), args.days)
+            server = standin.serve(Path(root), latency=args.latency)
+            process, base = start_app({
+                **standin.base_urls(server),
+                # the workers share one copy of the data, as deployed
+                "SNAPSHOT_DIR": str(Path(root) / "snapshots"),
+                "CHART_DATA_DIR": str(Path(root) / "chart_data"),
+                "PRERENDER_DIR": "",
+            }, args.workers)
+            pid = process.pid
+        url = base.replace("http", "ws", 1).rstrip("/") + "/websocket/"
+        try:
+            result = asyncio.run(load(url, args.sessions, args.actions, args.think,
+                                      args.ramp, args.timeout, args.seed, pid))
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+            if server is not None:
+                server.shutdown()
+
+    commit = _git("rev-parse", "--short", "HEAD")
+    report = {
+        "meta": {
+            "commit": commit,
+            "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "sessions": args.sessions,
+            "actions": args.actions,
+            "think": args.think,
+            "ramp": args.ramp,
+            "workers": args.workers if args.url is None else None,
+            "days": args.days if args.url is None else None,
+        },
+        **result,
+    }
+    output = args.output or RESULTS_DIR / \
+        f"load-{datetime.now():%Y%m%d-%H%M%S}-{commit or 'unknown'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+
+    width = max(map(len, result["outputs"]), default=0)
+    print(f"{'output':<{width}}  {'count':>6} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'timeouts':>8}")
+    for name, stats in result["outputs"].items():
+        print(f"{name:<{width}}  {stats['count']:6d} {stats['p50_ms']:9.0f} "
+              f"{stats['p95_ms']:9.0f} {stats['p99_ms']:9.0f} {stats['timeouts']:8d}")
+    print(f"{result['actions']} interactions in {result['seconds']:.1f} s, "
+          f"{result['throughput']['actions_per_s']:.1f}/s, "
+          f"{result['throughput']['outputs_per_s']:.1f} outputs/s, "
+          f"{result['errors']} errors")
+    if result["resources"]:
+        print(f"peak RSS {max(s['rss_mb'] for s in result['resources']):.0f} MB, "
+              f"mean CPU {np.mean([s['cpu_percent'] for s in result['resources']]):.0f}%")
+    print(f"written to {output}")
+
+
+if __name__ == "__main__":
+    main()
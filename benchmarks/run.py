@@ -0,0 +1,217 @@
+import argparse
+import importlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from itertools import cycle
+from pathlib import Path
+
+from benchmarks import standin, synthetic
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+
+def _git(*args) -> str:
+    try:
+        return subprocess.run(["git", *args], capture_output=True, text=True,
+                              cwd=Path(__file__).parent).stdout.strip()
+    except OSError:
+        return ""
+
+
+def timeit(fn, repeat: int, setup=None) -> dict:
+    # setup runs untimed before every round
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return {
+        "rounds": repeat,
+        "min_ms": min(times),
+        "median_ms": statistics.median(times),
+        "mean_ms": statistics.fmean(times),
+        "max_ms": max(times),
+    }
+
+
+def run(repeat: int) -> dict:
+    # imported here, once the environment points endpoints at the stand-in
+    import chart_data
+    import chart_registry
+    import dataset_store
+    import datasets
+    import derived_metrics
+    import endpoints
+    import instrumentation
+    import kpi_table
+    import metrics_box
+    import plot_figure
+    import positivity
+    import prefecture_dictionary
+    import spec_cache
+    import weekly_detail
+
+    pref = prefecture_dictionary.create_pref_dict()
+    names = [en for en, _ in pref.values()]
+
+    def reset():
+        # a fresh process as far as the data and derived caches are concerned
+        dataset_store.store = dataset_store.DatasetStore()
+        kpi_table._versions = None
+        derived_metrics._cache.clear()
+        weekly_detail._cubes.clear()
+        positivity._engines.clear()
+        spec_cache.cache = spec_cache.SpecCache()
+
+    def dashboard(ja: str, rb1: str = "year", rb2: str = "year"):
+        # what app.server renders for one session
+        name, order = pref[ja]
+        str(metrics_box.metrics_cards(name))
+        for chart, params in [
+            ("new_cases", {"prefecture": name, "range": rb1}),
+            ("new_cases_100k", {"prefecture": name, "range": rb2}),
+            ("generation_severe_cases", {"prefec_order": order}),
+            ("newly_cases_stack", {"pref_n": order}),
+            ("pcr_org", {}),
+            ("positive_rate", {}),
+        ]:
+            spec_cache.cache.get(
+                chart, params,
+                lambda: json.dumps(chart_data.spec(chart_registry.build(chart, params))))
+
+    def every_prefecture(fn):
+        return lambda: [fn(name) for name in names]
+
+    results = {}
+    results["dashboard.cold"] = timeit(lambda: dashboard("全国"), repeat, setup=reset)
+
+    # the remaining benchmarks run with every dataset already downloaded
+    reset()
+    dashboard("全国")
+    # a switch renders a prefecture no session has asked for yet
+    switches = cycle(list(pref)[1:])
+    results["dashboard.prefecture_switch"] = timeit(
+        lambda: dashboard(next(switches)), repeat)
+
+    # parsing alone, from the bytes already downloaded, and what it holds
+    memory = {}
+    for url, schema in datasets.ENDPOINTS.items():
+        label = instrumentation.dataset_label(url)
+        body = dataset_store.store.fetch(url).body
+        results[f"datasets.parse[{label}]"] = timeit(
+            lambda: datasets.parse(schema, body), repeat)
+        memory[label] = int(dataset_store.read(url).memory_usage(deep=True).sum())
+
+    kpi = {
+        "metrics_box.metrics_get_diff": lambda name: metrics_box.metrics_get_diff(name),
+        "metrics_box.metrics_cumulative_newly_cases":
+            metrics_box.metrics_cumulative_newly_cases,
+        "metrics_box.death_cases_cumulative": metrics_box.death_cases_cumulative,
+        "metrics_box.week_average": lambda name: metrics_box.week_average(0, name),
+        "metrics_box.new_cases_p_10thousand": metrics_box.new_cases_p_10thousand,
+        "metrics_box.metrics_card_item":
+            lambda name: str(metrics_box.metrics_card_item(name, 123456, -789)),
+    }
+    for bench, fn in kpi.items():
+        results[f"{bench}[all prefectures]"] = timeit(every_prefecture(fn), repeat)
+
+    def rebuild_kpi_table():
+        kpi_table._versions = None
+    results["kpi_table.get_table"] = timeit(kpi_table.get_table, repeat,
+                                            setup=rebuild_kpi_table)
+
+    # chart builders, serialized the way render_widget sends them
+    charts = {
+        "plot_figure.plot_new_cases": lambda: plot_figure.plot_new_cases(
+            "year", endpoints.NEWLY_CONFIRMED_DAILY, 50000, "#fd6262", "Tokyo"),
+        "plot_figure.plot_generation_severe_cases":
+            lambda: plot_figure.plot_generation_severe_cases(
+                endpoints.NEWLY_CONFIRMED_DETAIL_WEEKLY, 13),
+        "plot_figure.plot_newly_cases_stack":
+            lambda: plot_figure.plot_newly_cases_stack(
+                endpoints.NEWLY_CONFIRMED_DETAIL_WEEKLY, pref_n=13),
+        "plot_figure.plot_pcr_org": lambda: plot_figure.plot_pcr_org(endpoints.PCR_CASE),
+        "plot_figure.plot_positive_rate": lambda: plot_figure.plot_positive_rate(
+            endpoints.PCR_TESTED, endpoints.NEWLY_CONFIRMED_DAILY),
+    }
+    for bench, build in charts.items():
+        results[bench] = timeit(lambda: chart_data.spec(build()), repeat)
+
+    # the same, with the shared cube and positivity engine rebuilt every time
+    def drop_derived():
+        weekly_detail._cubes.clear()
+        positivity._engines.clear()
+    for bench in ["plot_figure.plot_generation_severe_cases",
+                  "plot_figure.plot_newly_cases_stack",
+                  "plot_figure.plot_positive_rate"]:
+        results[f"{bench}[cold]"] = timeit(lambda: chart_data.spec(charts[bench]()),
+                                           repeat, setup=drop_derived)
+    return results, memory
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark the dashboard "
+                                                 "against synthetic data")
+    parser.add_argument("--days", type=int, default=1000,
+                        help="length of the generated history")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0,
+                        help="seconds the stand-in adds to every response")
+    parser.add_argument("--output", type=Path,
+                        help=f"result file, default {RESULTS_DIR}/<time>-<commit>.json")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        synthetic.generate(Path(root), args.days)
+        server = standin.serve(Path(root), latency=args.latency)
+        os.environ.update(standin.base_urls(server))
+        # no snapshots, every cold run downloads and parses from scratch
+        os.environ["SNAPSHOT_DIR"] = ""
+        os.environ["CHART_DATA_DIR"] = str(Path(root) / "chart_data")
+        # synthetic imported endpoints before the environment was set
+        importlib.reload(sys.modules["endpoints"])
+        try:
+            results, memory = run(args.repeat)
+        finally:
+            server.shutdown()
+
+    commit = _git("rev-parse", "--short", "HEAD")
+    report = {
+        "meta": {
+            "commit": commit,
+            "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+            "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "days": args.days,
+            "repeat": args.repeat,
+            "latency": args.latency,
+        },
+        "results": results,
+        # bytes held by each parsed dataset
+        "memory": memory,
+    }
+    output = args.output or RESULTS_DIR / \
+        f"{datetime.now():%Y%m%d-%H%M%S}-{commit or 'unknown'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+
+    width = max(map(len, results))
+    for name, stats in results.items():
+        print(f"{name:<{width}}  {stats['median_ms']:10.2f} ms")
+    for name, size in memory.items():
+        print(f"{name:<{width}}  {size / 1024:10.1f} KiB")
+    print(f"written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import argparse
+import gzip
+import hashlib
+import threading
+import time
+from email.utils import formatdate
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from benchmarks import synthetic
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    # serves the generated files the way the MHLW hosts do: ETag and
+    # Last-Modified revalidation, byte ranges and gzip
+    def __init__(self, *args, root: Path, latency: float = 0, **kwargs):
+        self.root = root
+        self.latency = latency
+        super().__init__(*args, **kwargs)
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self._respond(head=True)
+
+    def do_GET(self):
+        self._respond(head=False)
+
+    def _respond(self, head: bool):
+        if self.latency:
+            time.sleep(self.latency)
+        path = (self.root / self.path.split("?")[0].lstrip("/")).resolve()
+        if self.root not in path.parents or not path.is_file():
+            self.send_error(404)
+            return
+        body = path.read_bytes()
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        last_modified = formatdate(path.stat().st_mtime, usegmt=True)
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        status, headers = 200, {}
+        ranges = self.headers.get("Range", "")
+        if ranges.startswith("bytes="):
+            start, _, end = ranges[6:].partition("-")
+            start = int(start)
+            end = min(int(end), len(body) - 1) if end else len(body) - 1
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(body)}")
+                self.end_headers()
+                return
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(body)}"
+            body = body[start:end + 1]
+        elif "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, 6)
+            headers["Content-Encoding"] = "gzip"
+
+        self.send_response(status)
+        headers.update({"Content-Type": "text/csv", "Content-Length": str(len(body)),
+                        "ETag": etag, "Last-Modified": last_modified,
+                        "Accept-Ranges": "bytes"})
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+
+def serve(root: Path, host: str = "127.0.0.1", port: int = 0,
+          latency: float = 0) -> ThreadingHTTPServer:
+    # starts in a daemon thread; port 0 picks a free one
+    handler = partial(StandinHandler, root=Path(root).resolve(), latency=latency)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def base_urls(server: ThreadingHTTPServer) -> dict:
+    # environment for endpoints.py
+    host, port = server.server_address[:2]
+    return {
+        "MHLW_OPENDATA_BASE": f"http://{host}:{port}/{synthetic.OPENDATA_DIR}",
+        "MHLW_CONTENT_BASE": f"http://{host}:{port}/{synthetic.CONTENT_DIR}",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="serve synthetic MHLW CSVs")
+    parser.add_argument("root", type=Path)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0,
+                        help="seconds added to every response")
+    args = parser.parse_args()
+    server = serve(args.root, args.host, args.port, args.latency)
+    for name, value in base_urls(server).items():
+        print(f"{name}={value}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+# a cold `import app` on the reference machine
+DEFAULT_BUDGET_MS = float(os.environ.get("STARTUP_BUDGET_MS", 1500))
+
+
+def import_times(module: str = "app") -> list:
+    # (module, self ms, cumulative ms, depth) for every import of a fresh
+    # interpreter, as reported by -X importtime
+    env = {**os.environ, "SNAPSHOT_DIR": ""}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us) / 1000,
+                     int(cumulative_us) / 1000, depth))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="import-time breakdown of a "
+                                                 "cold worker start")
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--output", type=Path, help="also write the rows as JSON")
+    args = parser.parse_args()
+
+    # children are listed before their parent, so the module's own imports
+    # are the rows since the previous top-level one
+    rows = import_times(args.module)
+    end = max(i for i, row in enumerate(rows) if row[0] == args.module and row[3] == 0)
+    start = max((i for i, row in enumerate(rows[:end]) if row[3] == 0), default=-1) + 1
+    rows = rows[start:end + 1]
+    total = rows[-1][2]
+
+    # direct dependencies of the module first, then the heaviest modules overall
+    print(f"{'module':<40} {'self ms':>9} {'cumul. ms':>10}")
+    for name, self_ms, cumulative_ms, depth in rows:
+        if depth == 1:
+            print(f"{name:<40} {self_ms:9.1f} {cumulative_ms:10.1f}")
+    print()
+    for name, self_ms, cumulative_ms, _ in sorted(rows, key=lambda row: -row[1])[:args.top]:
+        print(f"{name:<40} {self_ms:9.1f} {cumulative_ms:10.1f}")
+    print(f"\nimport {args.module}: {total:.0f} ms (budget {args.budget_ms:.0f} ms)")
+
+    if args.output:
+        args.output.write_text(json.dumps(
+            {"total_ms": total, "budget_ms": args.budget_ms,
+             "modules": [dict(zip(["module", "self_ms", "cumulative_ms", "depth"], row))
+                         for row in rows]}, indent=2))
+    sys.exit(1 if total > args.budget_ms else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import endpoints
+import prefecture_dictionary
+
+# layout served by standin.py, mirroring the two MHLW hosts
+OPENDATA_DIR = "public/opendata"
+CONTENT_DIR = "content"
+FIRST_DAY = "2020-01-16"
+AGE_BANDS = ["Under 10", "10s", "20s", "30s", "40s", "50s", "60s", "70s",
+             "80s", "Over 90"]
+PCR_ORGANIZATIONS = ["国立感染症研究所", "検疫所", "地方衛生研究所・保健所",
+                     "民間検査会社(主に行政検査)", "大学等", "医療機関",
+                     "民間検査会社(主に自費検査)", "その他", "不明"]
+
+
+def _file_name(url: str) -> str:
+    return url.rsplit("/", 1)[1]
+
+
+def _date_labels(dates: pd.DatetimeIndex) -> list:
+    # "2020/1/16", as in the MHLW files
+    return [f"{d.year}/{d.month}/{d.day}" for d in dates]
+
+
+def _waves(rng: np.random.Generator, days: int, n_prefs: int) -> np.ndarray:
+    # a few overlapping epidemic waves with per-prefecture scale and noise,
+    # so charts and downsampling see realistic shapes
+    t = np.arange(days)[:, None]
+    curve = np.zeros((days, 1))
+    for centre in rng.uniform(0, days, size=max(days // 150, 1)):
+        curve += rng.uniform(0.2, 1.0) * np.exp(-((t - centre) / rng.uniform(10, 40)) ** 2)
+    scale = rng.lognormal(6, 1, size=(1, n_prefs))
+    return rng.poisson(curve * scale + 1)
+
+
+def generate(out: Path, days: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    out = Path(out)
+    (out / OPENDATA_DIR).mkdir(parents=True, exist_ok=True)
+    (out / CONTENT_DIR).mkdir(parents=True, exist_ok=True)
+
+    prefectures = [en for en, _ in prefecture_dictionary.create_pref_dict().values()][1:]
+    dates = pd.date_range(FIRST_DAY, periods=days)
+    labels = _date_labels(dates)
+
+    def wide(values: np.ndarray) -> pd.DataFrame:
+        df = pd.DataFrame(values, columns=prefectures)
+        df.insert(0, "ALL", values.sum(axis=1))
+        df.insert(0, "Date", labels)
+        return df
+
+    def opendata(url: str, df: pd.DataFrame):
+        df.to_csv(out / OPENDATA_DIR / _file_name(url), index=False)
+
+    cases = _waves(rng, days, len(prefectures))
+    opendata(endpoints.NEWLY_CONFIRMED_DAILY, wide(cases))
+    opendata(endpoints.SEVERE_DAILY, wide(cases // 50))
+    opendata(endpoints.DEATHS_CUMULATIVE, wide(np.cumsum(cases // 200, axis=0)))
+
+    # weekly detail: a row of prefecture names above 20 "<sex> <band>" columns
+    # per prefecture, with suppressed cells written as "*"
+    names = ["ALL"] + prefectures
+    n_weeks = days // 7
+    counts = rng.integers(0, 2000, size=(n_weeks, len(names) * 20)).astype(str)
+    counts[rng.random(counts.shape) < 0.05] = "*"
+    lines = [
+        "," + ",".join(",".join([name] + [""] * 19) for name in names),
+        "Week," + ",".join(f"{sex} {band}" for _ in names
+                           for sex in ("Male", "Female") for band in AGE_BANDS),
+    ]
+    for week, row in enumerate(counts):
+        start, end = dates[week * 7], dates[week * 7 + 6]
+        lines.append(f"{start:%Y/%m/%d}~{end:%Y/%m/%d}," + ",".join(row))
+    (out / OPENDATA_DIR / _file_name(endpoints.NEWLY_CONFIRMED_DETAIL_WEEKLY))\
+        .write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    pcr = pd.DataFrame({"日付": labels,
+                        "PCR 検査実施件数(単日)": cases.sum(axis=1) * 8 + 100})
+    pcr.to_csv(out / CONTENT_DIR / _file_name(endpoints.PCR_TESTED), index=False)
+    by_org = pd.DataFrame(
+        rng.poisson(cases.sum(axis=1, keepdims=True)
+                    * rng.uniform(0.1, 3, size=len(PCR_ORGANIZATIONS))),
+        columns=PCR_ORGANIZATIONS)
+    by_org.insert(0, "日付", labels)
+    by_org.to_csv(out / CONTENT_DIR / _file_name(endpoints.PCR_CASE), index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="write synthetic MHLW CSVs")
+    parser.add_argument("out", type=Path)
+    parser.add_argument("--days", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate(args.out, args.days, args.seed)
+
+
+if __name__ == "__main__":
+    main()
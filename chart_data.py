@@ -0,0 +1,196 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+import instrumentation
+import lazy_import
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+alt = lazy_import.lazy_module("altair")
+
+# chart datasets as files named by the hash of their content, shared by the
+# workers of a host; specs reference them instead of carrying the values
+DIRECTORY = Path(os.environ.get("CHART_DATA_DIR")
+                 or Path(tempfile.gettempdir()) / "py-shiny-covid-chart-data")
+# files no chart has been built or served with for this many seconds are
+# deleted
+MAX_AGE = float(os.environ.get("CHART_DATA_MAX_AGE", 7 * 24 * 3600))
+# how often a cached spec marks the files it references as still in use
+TOUCH_INTERVAL = min(3600, MAX_AGE / 4)
+# altair's guard against embedding huge datasets in a spec, raised since the
+# data is fetched from its own URL
+MAX_ROWS = int(os.environ.get("CHART_DATA_MAX_ROWS", 50_000))
+# relative, so the URLs still resolve when the app is mounted under a prefix
+URL_PREFIX = "chart_data"
+# functions returning more directories to serve files from, e.g. the
+# pre-rendered version in use
+fallbacks: list = []
+
+# Content-Encoding -> (file suffix, compress), preferred first; every file is
+# stored compressed next to the plain one
+ENCODINGS = {"gzip": (".gz", lambda body: gzip.compress(body, 9, mtime=0))}
+if brotli is not None:
+    ENCODINGS = {"br": (".br", brotli.compress), **ENCODINGS}
+_HEADERS = {"Cache-Control": "public, max-age=31536000, immutable",
+            "Vary": "Accept-Encoding"}
+_NAME = re.compile(r"[0-9a-f]{32}\.json")
+_REFERENCE = re.compile(rf'"{URL_PREFIX}/([0-9a-f]{{32}}\.json)"')
+
+_lock = threading.Lock()
+_ready = False
+
+
+def _write(path: Path, body: bytes):
+    # renamed into place, so a reader never sees a partial file
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}")
+    tmp.write_bytes(body)
+    os.replace(tmp, path)
+
+
+def save(directory: Path, body: bytes) -> str:
+    # the file name; an existing file is only marked as still in use
+    name = f"{hashlib.sha256(body).hexdigest()[:32]}.json"
+    path = directory / name
+    try:
+        os.utime(path)
+        return name
+    except FileNotFoundError:
+        pass
+    directory.mkdir(parents=True, exist_ok=True)
+    for suffix, compress in ENCODINGS.values():
+        _write(path.with_name(name + suffix), compress(body))
+    # last, so the compressed files exist once it does
+    _write(path, body)
+    return name
+
+
+def _to_url(data) -> dict:
+    # altair data transformer: writes the dataset once and returns a
+    # reference to it
+    values = alt.utils.data.to_values(
+        alt.utils.data.limit_rows(data, max_rows=MAX_ROWS))["values"]
+    body = json.dumps(values, ensure_ascii=False, separators=(",", ":")).encode()
+    instrumentation.chart_data_bytes.observe(len(body))
+    return {"url": f"{URL_PREFIX}/{save(DIRECTORY, body)}",
+            "format": {"type": "json"}}
+
+
+def setup():
+    # altair's transformer registry is process-wide: it is set up once, before
+    # the first spec, and never touched while charts are being built
+    global _ready
+    if _ready:
+        return
+    with _lock:
+        if not _ready:
+            alt.data_transformers.register("chart_data", _to_url)
+            alt.data_transformers.enable("chart_data")
+            _ready = True
+
+
+def spec(chart) -> dict:
+    # the chart's Vega-Lite spec, its datasets written to DIRECTORY
+    setup()
+    return chart.to_dict()
+
+
+def references(spec: str) -> tuple:
+    # the files a serialized spec points at
+    return tuple(sorted(set(_REFERENCE.findall(spec))))
+
+
+def _find(name: str):
+    directories = [DIRECTORY] + [fallback() for fallback in fallbacks]
+    for directory in directories:
+        if directory is not None and (directory / name).exists():
+            return directory / name
+    return None
+
+
+def _tokens(value: str) -> list:
+    # the comma-separated list of a header
+    return [token.strip() for token in value.split(",") if token.strip()]
+
+
+def _accepted(value: str) -> dict:
+    # Accept-Encoding's codings and their q values; q=0 means not acceptable
+    accepted = {}
+    for token in _tokens(value):
+        coding, *params = [part.strip() for part in token.split(";")]
+        q = 1.0
+        for param in params:
+            key, _, number = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(number)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.lower()] = q
+    return accepted
+
+
+def _matches(etag: str, value: str) -> bool:
+    # If-None-Match uses the weak comparison, so W/ tags match too
+    tags = _tokens(value)
+    return "*" in tags or etag in [tag[2:] if tag.startswith("W/") else tag
+                                   for tag in tags]
+
+
+async def endpoint(request: Request) -> Response:
+    name = request.path_params["name"]
+    path = _find(name) if _NAME.fullmatch(name) else None
+    if path is None:
+        return Response(status_code=404)
+    # the name is the hash of the content, so it is a strong ETag and the
+    # file can be cached forever
+    headers = {**_HEADERS, "ETag": f'"{name[:-len(".json")]}"'}
+    if _matches(headers["ETag"], request.headers.get("if-none-match", "")):
+        return Response(status_code=304, headers=headers)
+    accepted = _accepted(request.headers.get("accept-encoding", ""))
+    for encoding, (suffix, _) in ENCODINGS.items():
+        encoded = path.with_name(name + suffix)
+        if accepted.get(encoding, accepted.get("*", 0)) > 0 and encoded.exists():
+            headers["Content-Encoding"] = encoding
+            path = encoded
+            break
+    return Response(path.read_bytes(), media_type="application/json",
+                    headers=headers)
+
+
+def touch(names) -> bool:
+    # marks the files as still in use, so no worker's prune deletes them;
+    # False when one is gone already and the spec must be built again
+    for name in names:
+        try:
+            os.utime(DIRECTORY / name)
+        except FileNotFoundError:
+            if _find(name) is None:
+                return False
+    return True
+
+
+def prune(max_age: float = MAX_AGE):
+    # a refresh callback; files are marked in use whenever a chart is built
+    # with them, and by the spec cache while it serves specs built earlier
+    cutoff = time.time() - max_age
+    for path in DIRECTORY.glob("*.json"):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+                for suffix, _ in ENCODINGS.values():
+                    path.with_name(path.name + suffix).unlink(missing_ok=True)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+# altair's default width for continuous x axes
+CHART_WIDTH = 400
+
+
+def lttb_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    # Largest-Triangle-Three-Buckets over evenly spaced x, keeps first and last
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    y = np.asarray(y, dtype=float)
+    x = np.arange(n, dtype=float)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+
+    out = np.empty(n_out, dtype=int)
+    out[0], out[-1] = 0, n - 1
+    prev = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        nxt_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:nxt_end].mean() if nxt_end > end else x[-1]
+        avg_y = y[end:nxt_end].mean() if nxt_end > end else y[-1]
+        area = np.abs((x[prev] - avg_x) * (y[start:end] - y[prev])
+                      - (x[prev] - x[start:end]) * (avg_y - y[prev]))
+        prev = start + int(np.argmax(area))
+        out[i + 1] = prev
+    return out
+
+
+def minmax_indices(y: np.ndarray, n_buckets: int) -> np.ndarray:
+    # the min and max of each bucket, for series where spikes must survive
+    n = len(y)
+    if 2 * n_buckets >= n:
+        return np.arange(n)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(0, n, n_buckets + 1).astype(int)
+    picks = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        chunk = y[start:end]
+        picks += [start + int(np.argmin(chunk)), start + int(np.argmax(chunk))]
+    return np.unique(picks)
+
+
+def compact_dates(df: pd.DataFrame, column: str = "Date") -> pd.DataFrame:
+    # "2022-01-31" instead of altair's "2022-01-31T00:00:00", encode as :T
+    return df.assign(**{column: df[column].dt.strftime("%Y-%m-%d")})
+
+
+def reduce_series(df: pd.DataFrame, x: str, y: str, width: int = CHART_WIDTH,
+                  points_per_pixel: float = 0.5) -> pd.DataFrame:
+    # keep only the encoded fields and at most one point per two pixels: a
+    # year of days is thinned out, the shorter presets are sent as they are
+    df = df[[x, y]]
+    n_out = int(width * points_per_pixel)
+    if len(df) > n_out:
+        df = df.iloc[lttb_indices(df[y].to_numpy(), n_out)]
+    return compact_dates(df, x)
+
+
+def reduce_stacked(df: pd.DataFrame, x: str, width: int = CHART_WIDTH,
+                   points_per_pixel: float = 0.5) -> pd.DataFrame:
+    # df is wide, one column per series; rows are picked on the stack total
+    # so every series keeps the same x values
+    n_out = int(width * points_per_pixel)
+    if len(df) > n_out:
+        total = df.drop(columns=x).sum(axis=1).to_numpy()
+        df = df.iloc[lttb_indices(total, n_out)]
+    return compact_dates(df, x)
@@ -0,0 +1,70 @@
+import endpoints
+import plot_figure
+import prefecture_dictionary
+
+# the preset values of the グラフ表示期間 radio buttons; custom ranges are
+# built on demand
+RANGES = ["week", "month", "3months", "year"]
+NEW_CASES_STYLES = {
+    "new_cases": {"url": endpoints.NEWLY_CONFIRMED_DAILY, "metric": None,
+                  "ytick_space": 50000, "color": "#fd6262"},
+    "new_cases_100k": {"url": endpoints.NEWLY_CONFIRMED_DAILY, "metric": "per_100k",
+                       "ytick_space": 40, "color": "#a1b8e8"},
+}
+
+_pref = prefecture_dictionary.create_pref_dict()
+PREFECTURES = [en for en, _ in _pref.values()]
+PREFECTURE_ORDERS = [order for _, order in _pref.values()]
+
+
+def _new_cases(name: str):
+    style = NEW_CASES_STYLES[name]
+
+    def build(prefecture: str, range: str, start=None, end=None):
+        return plot_figure.plot_new_cases(range, style["url"], style["ytick_space"],
+                                          style["color"], prefecture, start, end,
+                                          style["metric"])
+    return build
+
+
+def _comparison(prefectures: str, range: str, metric: str, start=None, end=None):
+    # prefectures is "all" or a comma separated list
+    names = PREFECTURES[1:] if prefectures == "all" else prefectures.split(",")
+    return plot_figure.plot_comparison(names, range, metric, start, end)
+
+
+# chart name -> (every params dict the dashboard can ask for, builder taking
+# those params). Names and params are the spec cache keys used in app.py
+CHARTS = {
+    "new_cases": (
+        [{"prefecture": p, "range": r} for p in PREFECTURES for r in RANGES],
+        _new_cases("new_cases")),
+    "new_cases_100k": (
+        [{"prefecture": p, "range": r} for p in PREFECTURES for r in RANGES],
+        _new_cases("new_cases_100k")),
+    "generation_severe_cases": (
+        [{"prefec_order": n} for n in PREFECTURE_ORDERS],
+        lambda prefec_order: plot_figure.plot_generation_severe_cases(
+            url=endpoints.NEWLY_CONFIRMED_DETAIL_WEEKLY, prefec_order=prefec_order)),
+    "newly_cases_stack": (
+        [{"pref_n": n} for n in PREFECTURE_ORDERS],
+        lambda pref_n: plot_figure.plot_newly_cases_stack(
+            url=endpoints.NEWLY_CONFIRMED_DETAIL_WEEKLY, pref_n=pref_n)),
+    "pcr_org": (
+        [{}],
+        lambda: plot_figure.plot_pcr_org(url=endpoints.PCR_CASE)),
+    "positive_rate": (
+        [{}],
+        lambda: plot_figure.plot_positive_rate(
+            url_pcr=endpoints.PCR_TESTED,
+            url_detected=endpoints.NEWLY_CONFIRMED_DAILY)),
+    # pre-rendered for all prefectures, other selections are built on demand
+    "comparison": (
+        [{"prefectures": "all", "range": r, "metric": m}
+         for r in RANGES for m in plot_figure.COMPARISON_METRICS],
+        _comparison),
+}
+
+
+def build(name: str, params: dict):
+    return CHARTS[name][1](**params)
@@ -0,0 +1,327 @@
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import pandas as pd
+
+import datasets
+import fetcher
+import instrumentation
+import snapshot_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = float(os.environ.get("DATASET_TTL", 600))
+# append-only files are downloaded in full every this many refreshes: the
+# tail alone never shows an upstream correction to an earlier row
+FULL_FETCH_EVERY = int(os.environ.get("DATASET_FULL_FETCH_EVERY", 24))
+
+
+def _parse(body: bytes, kwargs: dict) -> pd.DataFrame:
+    if "schema" in kwargs:
+        return datasets.parse(kwargs["schema"], body)
+    return pd.read_csv(io.BytesIO(body), **kwargs)
+
+
+class _Entry:
+    def __init__(self, url: str):
+        self.url = url
+        self.lock = threading.Lock()
+        self.body: bytes = b""
+        self.etag = None
+        self.last_modified = None
+        self.checked_at = 0.0
+        self.version = 0
+        self.frames: dict = {}
+        # refreshes since the last full download
+        self.tail_refreshes = 0
+
+
+class DatasetStore:
+    def __init__(self, ttl: float = DEFAULT_TTL, timeout: float = 30,
+                 full_fetch_every: int = FULL_FETCH_EVERY):
+        self.ttl = ttl
+        self.timeout = timeout
+        self.full_fetch_every = full_fetch_every
+        self._entries: dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        # bumped whenever any dataset gets a new version
+        self.generation = 0
+        self._fingerprint = (None, None, None)
+
+    def _entry(self, url: str) -> _Entry:
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                entry = self._entries[url] = _Entry(url)
+                self._load_snapshot(entry)
+            return entry
+
+    def _load_snapshot(self, entry: _Entry, snapshot: dict = None):
+        snapshot = snapshot or snapshot_cache.load(entry.url)
+        if snapshot is None:
+            return
+        # checked_at stays at 0, the first read revalidates it conditionally
+        entry.body = snapshot["body"]
+        entry.etag = snapshot["etag"]
+        entry.last_modified = snapshot["last_modified"]
+        entry.version = snapshot["version"]
+        entry.frames = snapshot["frames"]
+
+    def _is_fresh(self, entry: _Entry) -> bool:
+        if not entry.version:
+            return False
+        return time.monotonic() - entry.checked_at < self.ttl
+
+    def _conditional_headers(self, entry: _Entry) -> dict:
+        headers = {}
+        if entry.version:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def _apply(self, entry: _Entry, status: int, body: bytes, etag, last_modified):
+        entry.checked_at = time.monotonic()
+        if status == 304 and entry.version:
+            return
+        entry.etag = etag
+        entry.last_modified = last_modified
+        # some servers ignore the validators; skip re-parsing identical bytes
+        if body == entry.body:
+            return
+        entry.body = body
+        entry.frames = {}
+        entry.version += 1
+        self.generation += 1
+        snapshot_cache.save_raw(entry.url, entry.version, body,
+                                etag=etag, last_modified=last_modified)
+
+    def _revalidate(self, entry: _Entry):
+        headers = {"Accept-Encoding": "identity", **self._conditional_headers(entry)}
+        dataset = instrumentation.dataset_label(entry.url)
+        try:
+            with instrumentation.stage("download", dataset=dataset):
+                with urlopen(Request(entry.url, headers=headers),
+                             timeout=self.timeout) as res:
+                    body = res.read()
+            instrumentation.fetched_bytes.inc(len(body), dataset=dataset)
+            self._apply(entry, res.status, body,
+                        res.headers.get("ETag"), res.headers.get("Last-Modified"))
+        except HTTPError as e:
+            if e.code == 304 and entry.version:
+                self._apply(entry, 304, b"", None, None)
+                return
+            raise
+
+    def fetch(self, url: str) -> _Entry:
+        entry = self._entry(url)
+        if self._is_fresh(entry):
+            return entry
+        with entry.lock:
+            if not self._is_fresh(entry):
+                try:
+                    self._revalidate(entry)
+                except OSError:
+                    if not entry.version:
+                        raise
+                    # upstream is unreachable, keep serving what we have
+                    logger.warning("serving stale %s", entry.url, exc_info=True)
+                    entry.checked_at = time.monotonic()
+        return entry
+
+    def _append_tail(self, entry: _Entry, tail: bytes, etag, last_modified) -> bool:
+        # tail starts with the last row we already have; returns False when
+        # the new rows can't simply be appended
+        body = entry.body
+        header = body[:body.index(b"\n") + 1]
+        last_row = body[body.rstrip(b"\r\n").rfind(b"\n") + 1:]
+        new_rows = tail[len(last_row):]
+        with entry.lock:
+            entry.checked_at = time.monotonic()
+            if not new_rows.strip():
+                return True
+            last_date = pd.to_datetime(last_row.split(b",", 1)[0].decode())
+            dates = pd.to_datetime([line.split(b",", 1)[0].decode()
+                                    for line in new_rows.splitlines() if line.strip()])
+            if not (dates > last_date).all():
+                return False
+
+            # frames parsed with default options or a schema are extended
+            # row-wise, the others are parsed again on their next read
+            frames = {}
+            dataset = instrumentation.dataset_label(entry.url)
+            for key, df in entry.frames.items():
+                kwargs = dict(key)
+                if kwargs and "schema" not in kwargs:
+                    continue
+                with instrumentation.stage("parse", dataset=dataset):
+                    new = _parse(header + new_rows, kwargs)
+                instrumentation.parsed_rows.inc(len(new), dataset=dataset)
+                frames[key] = pd.concat([df, new], ignore_index=not kwargs)
+            entry.body = body + new_rows
+            entry.frames = frames
+            entry.etag = etag
+            entry.last_modified = last_modified
+            entry.version += 1
+            self.generation += 1
+            snapshot_cache.save_raw(entry.url, entry.version, entry.body,
+                                    etag=etag, last_modified=last_modified)
+            for key, df in frames.items():
+                snapshot_cache.save_frame(entry.url, entry.version, dict(key), df)
+        return True
+
+    async def _arefresh_tail(self, entry: _Entry) -> bool:
+        # asks only for the bytes past the last row we have, plus the header
+        # row to check the layout didn't change; False means do a full fetch
+        body = entry.body
+        header_end = body.index(b"\n") + 1
+        tail_start = body.rstrip(b"\r\n").rfind(b"\n") + 1
+        # ranges count encoded bytes, so ask for the file as stored
+        head, tail = await fetcher.fetch_many([
+            (entry.url, {"Accept-Encoding": "identity",
+                         "Range": f"bytes=0-{header_end - 1}"}),
+            (entry.url, {**self._conditional_headers(entry),
+                         "Accept-Encoding": "identity",
+                         "Range": f"bytes={tail_start}-"}),
+        ])
+        if isinstance(tail, BaseException) or isinstance(head, BaseException):
+            return False
+        status, data, etag, last_modified = tail
+        if status == 304:
+            await asyncio.to_thread(self._apply, entry, 304, b"", None, None)
+            return True
+        if status != 206 or head[0] != 206 or head[1] != body[:header_end] \
+                or not data.startswith(body[tail_start:]):
+            return False
+        return await asyncio.to_thread(
+            self._append_tail, entry, data, etag, last_modified)
+
+    async def arefresh(self, urls: list, read_options: dict = None,
+                       append_only: set = frozenset()) -> list:
+        # refreshes every url concurrently over the pooled async client, and
+        # applies and parses each response in a worker thread; append-only
+        # files only download their new rows. Returns the exception raised
+        # for each url, or None. Every full_fetch_every-th refresh of an
+        # append-only file is a full conditional GET, which picks up rows
+        # revised upstream
+        read_options = read_options or {}
+
+        def apply(entry, response):
+            with entry.lock:
+                self._apply(entry, *response)
+
+        async def one(url):
+            entry = self._entry(url)
+            try:
+                tail = (url in append_only and entry.version and entry.body
+                        and entry.tail_refreshes < self.full_fetch_every)
+                if tail and await self._arefresh_tail(entry):
+                    entry.tail_refreshes += 1
+                else:
+                    response = await fetcher.fetch(
+                        url, self._conditional_headers(entry))
+                    await asyncio.to_thread(apply, entry, response)
+                    entry.tail_refreshes = 0
+                await asyncio.to_thread(
+                    lambda: self.read_csv(url, **read_options.get(url, {})))
+            except Exception as e:
+                return e
+
+        return await asyncio.gather(*(one(url) for url in urls))
+
+    def read(self, url: str) -> pd.DataFrame:
+        # the endpoint parsed with its registered schema
+        return self.read_csv(url, **datasets.READ_OPTIONS[url])
+
+    def read_csv(self, url: str, **kwargs) -> pd.DataFrame:
+        # the returned frame is shared by every session, never mutate it.
+        # schema="<name>" parses with that datasets.SCHEMAS entry, any other
+        # options go to pd.read_csv
+        entry = self.fetch(url)
+        key = tuple(sorted(kwargs.items()))
+        df = entry.frames.get(key)
+        if df is None:
+            with entry.lock:
+                df = entry.frames.get(key)
+                if df is None:
+                    dataset = instrumentation.dataset_label(url)
+                    with instrumentation.stage("parse", dataset=dataset):
+                        df = _parse(entry.body, kwargs)
+                    instrumentation.parsed_rows.inc(len(df), dataset=dataset)
+                    entry.frames[key] = df
+                    snapshot_cache.save_frame(url, entry.version, kwargs, df)
+        return df
+
+    def adopt_snapshot(self, url: str) -> bool:
+        # switches to the version another process published, if it differs
+        # from ours; its frames are views of the mapped snapshot files
+        entry = self._entry(url)
+        if snapshot_cache.current_version(url) in (None, entry.version):
+            return False
+        snapshot = snapshot_cache.load(url)
+        if snapshot is None:
+            return False
+        with entry.lock:
+            self._load_snapshot(entry, snapshot)
+            entry.checked_at = time.monotonic()
+            self.generation += 1
+        return True
+
+    def fingerprint(self, urls: list) -> str:
+        # identifies the loaded data by content, so it is the same in every
+        # process holding the same files whatever their version counters
+        generation, key, value = self._fingerprint
+        if generation == self.generation and key == tuple(urls):
+            return value
+        generation = self.generation
+        digest = hashlib.sha1()
+        for url in urls:
+            digest.update(url.encode())
+            digest.update(hashlib.sha1(self._entry(url).body).digest())
+        value = digest.hexdigest()[:16]
+        self._fingerprint = (generation, tuple(urls), value)
+        return value
+
+    def version(self, url: str) -> int:
+        return self._entry(url).version
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+
+    def collect_metrics(self) -> list:
+        with self._lock:
+            entries = list(self._entries.values())
+        return [
+            ("covid_dataset_version", "Version of each loaded dataset",
+             {(("dataset", instrumentation.dataset_label(e.url)),): e.version
+              for e in entries}),
+            ("covid_dataset_bytes", "Size of each loaded dataset",
+             {(("dataset", instrumentation.dataset_label(e.url)),): len(e.body)
+              for e in entries}),
+            ("covid_dataset_frame_bytes", "Memory held by the parsed frames of each dataset",
+             {(("dataset", instrumentation.dataset_label(e.url)),):
+              sum(int(df.memory_usage(deep=True).sum()) for df in e.frames.values())
+              for e in entries}),
+            ("covid_dataset_generation", "Number of dataset changes since start",
+             {(): self.generation}),
+        ]
+
+
+store = DatasetStore()
+
+
+def read(url: str) -> pd.DataFrame:
+    return store.read(url)
+
+
+def read_csv(url: str, **kwargs) -> pd.DataFrame:
+    return store.read_csv(url, **kwargs)
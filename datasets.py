@@ -0,0 +1,119 @@
+import csv
+import io
+
+import numpy as np
+import pandas as pd
+
+import endpoints
+
+DATE_FORMAT = "%Y/%m/%d"
+
+
+def _column_names(header: bytes) -> list:
+    # the labels read_csv gives: blanks become "Unnamed: i" and repeats get
+    # ".1", ".2", ... skipping any suffix another column already has
+    names = next(csv.reader([header.decode("utf-8-sig").rstrip("\r\n")]))
+    labels = [name or f"Unnamed: {i}" for i, name in enumerate(names)]
+    counts = {}
+    for i, name in enumerate(labels):
+        label = name
+        count = counts.get(name, 0)
+        while count:
+            counts[name] = count + 1
+            label = f"{name}.{count}"
+            count = count + 1 if label in labels else counts.get(label, 0)
+        labels[i] = label
+        counts[label] = count + 1
+    return labels
+
+
+class Schema:
+    # how one kind of MHLW file is laid out. It is parsed into a frame with a
+    # sorted DatetimeIndex named "Date" and value columns that all share one
+    # compact dtype, i.e. a single 2-D block: no per-row date strings, and
+    # counts take half the bytes of the int64/float64 pandas would infer
+    def __init__(self, name: str, dtype: str = "int32", skiprows: int = 0,
+                 na_values: tuple = (), drop_trailing: int = 0,
+                 week_range: bool = False):
+        self.name = name
+        self.dtype = np.dtype(dtype)
+        # rows above the header, e.g. the prefecture names of the weekly file
+        self.skiprows = skiprows
+        # cells that mean "no value"; only float dtypes can hold them as NaN
+        self.na_values = na_values
+        # columns at the end no chart uses, they are never parsed
+        self.drop_trailing = drop_trailing
+        # the date column reads "2020/01/16~2020/01/22", the index is the start
+        self.week_range = week_range
+
+    def _fast_values(self, rows: bytes, n_columns: int) -> np.ndarray:
+        # numpy's C tokenizer straight into the final dtype, a few times
+        # faster than read_csv for these all-numeric grids
+        for na in self.na_values:
+            # markers like "*" never occur inside a number or a date
+            rows = rows.replace(na.encode(), b"nan")
+        return np.loadtxt(io.BytesIO(rows), delimiter=",", dtype=self.dtype,
+                          usecols=range(1, n_columns), ndmin=2)
+
+    def _slow_values(self, rows: bytes, n_columns: int) -> np.ndarray:
+        # anything loadtxt rejects: quoting, blanks, decimals in a count column
+        df = pd.read_csv(io.BytesIO(rows), header=None, usecols=range(1, n_columns),
+                         na_values=list(self.na_values))
+        if self.dtype.kind != "f":
+            # blank counts count as zero, as the KPI table always did
+            df = df.fillna(0)
+        return df.to_numpy(dtype=self.dtype)
+
+    def parse(self, body: bytes) -> pd.DataFrame:
+        lines = body.split(b"\n", self.skiprows + 1)
+        header = lines[self.skiprows]
+        rows = lines[self.skiprows + 1] if len(lines) > self.skiprows + 1 else b""
+        names = _column_names(header)
+        n_columns = len(names) - self.drop_trailing
+
+        dates = [line.split(b",", 1)[0] for line in rows.splitlines() if line.strip()]
+        if not dates:
+            values = np.empty((0, n_columns - 1), dtype=self.dtype)
+        else:
+            try:
+                values = self._fast_values(rows, n_columns)
+            except ValueError:
+                values = self._slow_values(rows, n_columns)
+        if self.week_range:
+            dates = [date.split(b"~", 1)[0] for date in dates]
+        index = pd.DatetimeIndex(
+            pd.to_datetime([date.decode().strip('"') for date in dates],
+                           format=DATE_FORMAT),
+            name="Date")
+        if not index.is_monotonic_increasing:
+            order = np.argsort(index.to_numpy(), kind="stable")
+            index, values = index[order], values[order]
+        return pd.DataFrame(values, index=index, columns=names[1:n_columns],
+                            copy=False)
+
+
+SCHEMAS = {schema.name: schema for schema in [
+    Schema("daily_counts"),
+    # "*" marks cells suppressed for privacy, they are NaN (masked by the cube)
+    Schema("weekly_detail", dtype="float32", skiprows=1, na_values=("*",),
+           week_range=True),
+    # the last three organizations are not charted
+    Schema("pcr_case", drop_trailing=3),
+]}
+
+# the schema every endpoint is parsed with
+ENDPOINTS = {
+    endpoints.NEWLY_CONFIRMED_DAILY: "daily_counts",
+    endpoints.NEWLY_CONFIRMED_DETAIL_WEEKLY: "weekly_detail",
+    endpoints.SEVERE_DAILY: "daily_counts",
+    endpoints.DEATHS_CUMULATIVE: "daily_counts",
+    endpoints.PCR_TESTED: "daily_counts",
+    endpoints.PCR_CASE: "pcr_case",
+}
+
+# read_csv options for DatasetStore, keyed like its arefresh() expects
+READ_OPTIONS = {url: {"schema": name} for url, name in ENDPOINTS.items()}
+
+
+def parse(name: str, body: bytes) -> pd.DataFrame:
+    return SCHEMAS[name].parse(body)
@@ -0,0 +1,103 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+import dataset_store
+import endpoints
+import prefecture_dictionary
+
+# 2020 census population
+_CENSUS_2020 = {
+    "北海道": 5224614, "青森": 1237984, "岩手": 1210534, "宮城": 2301996,
+    "秋田": 959502, "山形": 1068027, "福島": 1833152, "茨城": 2867009,
+    "栃木": 1933146, "群馬": 1939110, "埼玉": 7344765, "千葉": 6284480,
+    "東京": 14047594, "神奈川": 9237337, "新潟": 2201272, "富山": 1034814,
+    "石川": 1132526, "福井": 766863, "山梨": 809974, "長野": 2048011,
+    "岐阜": 1978742, "静岡": 3633202, "愛知": 7542415, "三重": 1770254,
+    "滋賀": 1413610, "京都": 2578087, "大阪": 8837685, "兵庫": 5465002,
+    "奈良": 1324473, "和歌山": 922584, "鳥取": 553407, "島根": 671126,
+    "岡山": 1888432, "広島": 2799702, "山口": 1342059, "徳島": 719559,
+    "香川": 950244, "愛媛": 1334841, "高知": 691527, "福岡": 5135214,
+    "佐賀": 811442, "長崎": 1312317, "熊本": 1738301, "大分": 1123852,
+    "宮崎": 1069576, "鹿児島": 1588256, "沖縄": 1467480,
+}
+# population by the dataset column names, "ALL" being the whole country
+POPULATION = {en: _CENSUS_2020[ja]
+              for ja, (en, _) in prefecture_dictionary.create_pref_dict().items()
+              if ja in _CENSUS_2020}
+POPULATION["ALL"] = sum(_CENSUS_2020.values())
+# the counts the metrics are derived from unless told otherwise
+SOURCE = endpoints.NEWLY_CONFIRMED_DAILY
+
+
+def _frame(values: np.ndarray, like: pd.DataFrame) -> pd.DataFrame:
+    return pd.DataFrame(values, index=like.index, columns=like.columns)
+
+
+def _rolling_sum(values: np.ndarray, window: int) -> np.ndarray:
+    # trailing sums down every column at once; NaN until a full window
+    total = np.cumsum(values, axis=0, dtype=float)
+    out = np.full(values.shape, np.nan)
+    out[window - 1:] = total[window - 1:]
+    out[window:] -= total[:-window]
+    return out
+
+
+def _per_100k(values: np.ndarray, columns) -> np.ndarray:
+    # two decimals, as MHLW published them
+    population = np.array([POPULATION[c] for c in columns], dtype=float)
+    return np.round(values * 100_000 / population, 2)
+
+
+def per_100k(counts: pd.DataFrame) -> pd.DataFrame:
+    return _frame(_per_100k(counts.to_numpy(dtype=float), counts.columns), counts)
+
+
+def weekly_per_100k(counts: pd.DataFrame) -> pd.DataFrame:
+    # cases of the last 7 days per 100,000 residents
+    return _frame(_per_100k(_rolling_sum(counts.to_numpy(dtype=float), 7),
+                            counts.columns), counts)
+
+
+def rolling_mean(counts: pd.DataFrame, window: int = 7) -> pd.DataFrame:
+    return _frame(_rolling_sum(counts.to_numpy(dtype=float), window) / window,
+                  counts)
+
+
+def week_over_week(counts: pd.DataFrame) -> pd.DataFrame:
+    # the last 7 days over the 7 days before them
+    week = _rolling_sum(counts.to_numpy(dtype=float), 7)
+    ratio = np.full(week.shape, np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio[7:] = week[7:] / week[:-7]
+    return _frame(ratio, counts)
+
+
+# metric name -> function of the daily counts, every prefecture at once
+METRICS = {
+    "per_100k": per_100k,
+    "weekly_per_100k": weekly_per_100k,
+    "rolling_7d": rolling_mean,
+    "week_over_week": week_over_week,
+}
+
+_lock = threading.Lock()
+_cache: dict = {}
+
+
+def read(metric: str, url: str = SOURCE) -> pd.DataFrame:
+    # the metric over the daily counts the store holds for url, computed
+    # once per version of them
+    store = dataset_store.store
+    key = (url, metric)
+    cached = _cache.get(key)
+    if cached is not None and cached[0] == store.version(url):
+        return cached[1]
+    with _lock:
+        cached = _cache.get(key)
+        if cached is None or cached[0] != store.version(url):
+            counts = store.read(url)
+            # read may have picked up a newer version than we looked at
+            cached = _cache[key] = (store.version(url), METRICS[metric](counts))
+    return cached[1]
@@ -0,0 +1,29 @@
+import os
+
+# overridable so the app can be pointed at a mirror or the benchmark stand-in
+OPENDATA = os.environ.get("MHLW_OPENDATA_BASE",
+                          "https://covid19.mhlw.go.jp/public/opendata")
+CONTENT = os.environ.get("MHLW_CONTENT_BASE", "https://www.mhlw.go.jp/content")
+
+NEWLY_CONFIRMED_DAILY = f"{OPENDATA}/newly_confirmed_cases_daily.csv"
+NEWLY_CONFIRMED_DETAIL_WEEKLY = f"{OPENDATA}/newly_confirmed_cases_detail_weekly.csv"
+SEVERE_DAILY = f"{OPENDATA}/severe_cases_daily.csv"
+DEATHS_CUMULATIVE = f"{OPENDATA}/deaths_cumulative_daily.csv"
+PCR_TESTED = f"{CONTENT}/pcr_tested_daily.csv"
+PCR_CASE = f"{CONTENT}/pcr_case_daily.csv"
+
+ALL = [
+    NEWLY_CONFIRMED_DAILY,
+    NEWLY_CONFIRMED_DETAIL_WEEKLY,
+    SEVERE_DAILY,
+    DEATHS_CUMULATIVE,
+    PCR_TESTED,
+    PCR_CASE,
+]
+
+# files that only ever gain rows at the end, refreshed with Range requests
+APPEND_ONLY = {
+    NEWLY_CONFIRMED_DAILY,
+    SEVERE_DAILY,
+    DEATHS_CUMULATIVE,
+}
@@ -0,0 +1,47 @@
+import asyncio
+import os
+
+import httpx
+
+import instrumentation
+
+TIMEOUT = float(os.environ.get("FETCH_TIMEOUT", 30))
+
+_client = None
+
+
+def client() -> httpx.AsyncClient:
+    # one pooled client per process: connections are kept alive per host and
+    # responses are gzip-decoded transparently
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=TIMEOUT,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=16, max_keepalive_connections=8),
+        )
+    return _client
+
+
+async def fetch(url: str, headers: dict = None):
+    dataset = instrumentation.dataset_label(url)
+    with instrumentation.stage("download", dataset=dataset):
+        res = await client().get(url, headers=headers)
+    instrumentation.fetched_bytes.inc(len(res.content), dataset=dataset)
+    if res.status_code != 304:
+        res.raise_for_status()
+    return (res.status_code, res.content,
+            res.headers.get("ETag"), res.headers.get("Last-Modified"))
+
+
+async def fetch_many(requests: list) -> list:
+    # requests are (url, headers) pairs; failures are returned, not raised
+    return await asyncio.gather(
+        *(fetch(url, headers) for url, headers in requests), return_exceptions=True)
+
+
+async def aclose():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,227 @@
+import bisect
+import functools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from htmltools import HTML, Tag, TagList
+from shiny import reactive
+from shiny.session import get_current_session
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+
+logger = logging.getLogger("slow_render")
+
+# renders slower than this are logged with the inputs they ran for, unset
+# disables the log
+SLOW_RENDER_MS = float(os.environ.get("SLOW_RENDER_MS") or "inf")
+SLOW_RENDER_INPUTS = ["prefecture", "rb1", "rb2", "rb1_dates", "rb2_dates",
+                      "compare_prefs", "compare_metric", "rb3", "rb3_dates"]
+if SLOW_RENDER_MS != float("inf"):
+    logging.basicConfig()
+
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1,
+                2.5, 5, 10)
+BYTE_BUCKETS = (1e3, 4e3, 16e3, 64e3, 256e3, 1e6, 4e6, 16e6)
+
+
+def _label_text(labels: tuple) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in labels)
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        self._values: dict = {}
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines += self._samples(labels, value)
+        return lines
+
+    def _samples(self, labels: tuple, value) -> list:
+        return [f"{self.name}{_label_text(labels)} {value}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: tuple = TIME_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            # per-bucket counts, then sum and count
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _samples(self, labels: tuple, state) -> list:
+        counts, total, count = state
+        lines, cumulative = [], 0
+        for bound, n in zip([*self.buckets, "+Inf"], counts):
+            cumulative += n
+            le = _label_text(labels + (("le", bound),))
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+        lines.append(f"{self.name}_sum{_label_text(labels)} {total}")
+        lines.append(f"{self.name}_count{_label_text(labels)} {count}")
+        return lines
+
+
+stage_seconds = Histogram(
+    "covid_stage_seconds",
+    "Time spent per stage: download, parse, spec (chart to Vega-Lite dict), "
+    "widget (spec to widget JSON), plot (matplotlib figure to image)")
+function_seconds = Histogram(
+    "covid_function_seconds", "Time spent in metrics_box and plot_figure functions")
+render_seconds = Histogram("covid_render_seconds", "Time spent per output render")
+payload_bytes = Histogram("covid_payload_bytes", "Size of each rendered output",
+                          BYTE_BUCKETS)
+chart_data_bytes = Histogram("covid_chart_data_bytes",
+                             "Size of each chart dataset served by URL", BYTE_BUCKETS)
+fetched_bytes = Counter("covid_fetched_bytes_total", "Bytes downloaded per dataset")
+parsed_rows = Counter("covid_parsed_rows_total", "CSV rows parsed per dataset")
+active_sessions = Gauge("covid_active_sessions", "Connected Shiny sessions")
+
+METRICS = [stage_seconds, function_seconds, render_seconds, payload_bytes,
+           chart_data_bytes, fetched_bytes, parsed_rows, active_sessions]
+# functions returning extra gauges, read on every scrape
+_collectors = []
+
+
+def dataset_label(url: str) -> str:
+    return url.rsplit("/", 1)[-1]
+
+
+@contextmanager
+def stage(name: str, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, stage=name, **labels)
+
+
+def timed(fn):
+    # records every call of fn under its module-qualified name
+    name = f"{fn.__module__}.{fn.__name__}"
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            function_seconds.observe(time.perf_counter() - start, function=name)
+    return wrapper
+
+
+def payload_size(value):
+    # VegaWidget carries its spec as a JSON string, UI is sent as HTML; None
+    # for anything else (plots are encoded after the function returns)
+    spec = getattr(value, "_spec_source", None)
+    if spec is not None:
+        return len(spec.encode())
+    if isinstance(value, (Tag, TagList, HTML)):
+        return len(str(value).encode())
+    return None
+
+
+def _current_inputs(session) -> dict:
+    values = {}
+    with reactive.isolate():
+        for name in SLOW_RENDER_INPUTS:
+            try:
+                values[name] = session.input[name]()
+            except Exception:
+                values[name] = None
+    return values
+
+
+def rendered(output: str):
+    # times a render function and measures what it returns; goes between the
+    # render decorator and the function
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            value = fn(*args, **kwargs)
+            elapsed = time.perf_counter() - start
+            render_seconds.observe(elapsed, output=output)
+            size = payload_size(value)
+            if size is not None:
+                payload_bytes.observe(size, output=output)
+            if elapsed * 1000 > SLOW_RENDER_MS:
+                session = get_current_session()
+                logger.warning("slow render %s: %.0f ms, session %s, inputs %r",
+                               output, elapsed * 1000,
+                               session.id[:8] if session else "-",
+                               _current_inputs(session) if session else {})
+            return value
+        return wrapper
+    return decorator
+
+
+def track_session(session):
+    active_sessions.inc()
+    session.on_ended(lambda: active_sessions.inc(-1))
+
+
+def add_collector(fn):
+    # fn returns (name, help, {labels tuple: value}) gauges
+    _collectors.append(fn)
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    for collect in _collectors:
+        for name, help, values in collect():
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+            lines += [f"{name}{_label_text(labels)} {value}"
+                      for labels, value in values.items()]
+    return "\n".join(lines) + "\n"
+
+
+async def metrics_endpoint(request: Request) -> PlainTextResponse:
+    return PlainTextResponse(render_metrics(),
+                             media_type="text/plain; version=0.0.4")
@@ -0,0 +1,77 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+import dataset_store
+import derived_metrics
+import endpoints
+
+SOURCES = [
+    endpoints.NEWLY_CONFIRMED_DAILY,
+    endpoints.SEVERE_DAILY,
+    endpoints.DEATHS_CUMULATIVE,
+]
+# week_average_0 is the latest week, week_average_1 the one before, ...
+WEEK_AVERAGE_SHIFTS = 4
+
+_lock = threading.Lock()
+_versions = None
+_table = None
+_rows: dict = {}
+
+
+def _values(df: pd.DataFrame, columns: list) -> np.ndarray:
+    # the schemas already parsed every column as numbers
+    return df.reindex(columns=columns).to_numpy(dtype=float)
+
+
+def compute_kpi_table(daily: pd.DataFrame, severe: pd.DataFrame,
+                      deaths: pd.DataFrame) -> pd.DataFrame:
+    prefs = list(daily.columns)
+    new = _values(daily, prefs)
+    sev = _values(severe, prefs)
+    dea = _values(deaths, prefs)
+    p100k = derived_metrics.per_100k(daily.iloc[-2:]).to_numpy()
+
+    table = pd.DataFrame({
+        "new_cases": new[-1],
+        "new_cases_diff": new[-1] - new[-2],
+        "cumulative_cases": new.sum(axis=0),
+        "severe_cases": sev[-1],
+        "severe_cases_diff": sev[-1] - sev[-2],
+        "deaths": dea[-1],
+        "deaths_diff": dea[-1] - dea[-2],
+        **{
+            f"week_average_{shift}": new[-8-(7*shift):-1-(7*shift)].mean(axis=0)
+            for shift in range(WEEK_AVERAGE_SHIFTS)
+        },
+        "per100k": p100k[-1],
+        "per100k_diff": p100k[-1] - p100k[-2],
+    }, index=prefs)
+
+    counts = [c for c in table.columns if not c.startswith("per100k")]
+    table[counts] = table[counts].fillna(0).astype("int64")
+    return table
+
+
+def get_table() -> pd.DataFrame:
+    global _versions, _table, _rows
+    store = dataset_store.store
+    versions = tuple(store.version(url) for url in SOURCES)
+    if versions == _versions:
+        return _table
+    with _lock:
+        if versions != _versions:
+            frames = [store.read(url) for url in SOURCES]
+            # read may have picked up a newer version than we looked at
+            versions = tuple(store.version(url) for url in SOURCES)
+            _table = compute_kpi_table(*frames)
+            _rows = _table.to_dict("index")
+            _versions = versions
+    return _table
+
+
+def lookup(pref: str) -> dict:
+    get_table()
+    return _rows[pref]
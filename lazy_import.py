@@ -0,0 +1,38 @@
+import importlib.util
+import sys
+import threading
+
+# LazyLoader isn't thread-safe before Python 3.12: a second thread touching
+# the module while the first is still executing it sees it half-initialized
+_lock = threading.RLock()
+_lazy: list = []
+
+
+def lazy_module(name: str):
+    # returns the module without executing it; it is imported for real on
+    # the first attribute access. Keeps heavy libraries off the worker's
+    # startup path
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    _lazy.append(module)
+    return module
+
+
+def ensure_loaded(module):
+    # imports a lazy module now, e.g. before forking workers that would each
+    # import it again
+    with _lock:
+        module.__dict__
+    return module
+
+
+def load_all():
+    # every lazy module, before code that may run in several threads uses them
+    for module in _lazy:
+        ensure_loaded(module)
@@ -1,9 +1,10 @@
-import tomli
-
 from shiny.ui import p, span, div, br
-import pandas as pd
+
+import instrumentation
+import kpi_table
 
 
+@instrumentation.timed
 def metrics_card_item(str_title: str, num_main: int, num_sub=0):
 
     num_main_str = f'{num_main:,}'
@@ -46,36 +47,55 @@ def metrics_card_item(str_title: str, num_main: int, num_sub=0):
     return card
 
 
-# metrics1
-def metrics_get_diff(
-    pref: str,
-    url="https://covid19.mhlw.go.jp/public/opendata/newly_confirmed_cases_daily.csv"):
-    df = pd.read_csv(url)
-    num = df[pref]
-    today_num = num.iloc[-1]
-    diff = int(today_num) - int(num.iloc[-2])
-    return int(today_num), diff
+# metrics, all served from the precomputed all-prefecture table
+@instrumentation.timed
+def metrics_get_diff(pref: str, kpi: str = "new_cases"):
+    row = kpi_table.lookup(pref)
+    return row[kpi], row[f"{kpi}_diff"]
+
+@instrumentation.timed
+def metrics_cumulative_newly_cases(pref: str):
+    return kpi_table.lookup(pref)["cumulative_cases"]
+
+@instrumentation.timed
+def death_cases_cumulative(pref: str):
+    row = kpi_table.lookup(pref)
+    return row["deaths"], row["deaths_diff"]
 
-def metrics_cumulative_newly_cases(
-    pref: str,
-    url="https://covid19.mhlw.go.jp/public/opendata/newly_confirmed_cases_daily.csv"):
-    df = pd.read_csv(url)
-    return pd.to_numeric(df[pref]).sum()
+@instrumentation.timed
+def week_average(week_shift: int, pref: str) -> int:
+    return int(kpi_table.lookup(pref)[f"week_average_{week_shift}"])
 
-def death_cases_cumulative(
-    pref: str,
-    url="https://covid19.mhlw.go.jp/public/opendata/deaths_cumulative_daily.csv"
-):
-    df = pd.read_csv(url)
-    deaths = pd.to_numeric(df[pref])
-    diff = deaths.iloc[-1] - deaths.iloc[-2]
-    return deaths.iloc[-1], diff
+@instrumentation.timed
+def new_cases_p_10thousand(pref: str):
+    row = kpi_table.lookup(pref)
+    return int(row["per100k"]), int(row["per100k_diff"])
 
-def week_average(url: str, week_shift: int, pref: str) -> int:
-    df = pd.read_csv(url)
-    ave = df[pref].iloc[-8-(7*week_shift):-1-(7*week_shift)].mean()
-    return int(ave)
 
-def new_cases_p_10thousand(url: str, pref: str):
-    df = pd.read_csv(url)
-    return int(df["ALL"].iloc[-1]), int(df["ALL"].iloc[-2]) - int(df["ALL"].iloc[-1])
+@instrumentation.timed
+def metrics_cards(pref: str):
+    # the four KPI cards shown above the tab 1 charts
+    new_cases, new_cases_diff = metrics_get_diff(pref=pref)
+    severe_cases, severe_cases_diff = metrics_get_diff(pref=pref, kpi="severe_cases")
+    deaths, deaths_diff = death_cases_cumulative(pref=pref)
+    return div(
+        div(
+            metrics_card_item(
+                str_title="新規の陽性者数",
+                num_main=new_cases,
+                num_sub=new_cases_diff),
+            metrics_card_item(
+                str_title="陽性者の累積",
+                num_main=metrics_cumulative_newly_cases(pref=pref)),
+            metrics_card_item(
+                str_title="現在の重症者数",
+                num_main=severe_cases,
+                num_sub=severe_cases_diff),
+            metrics_card_item(
+                str_title="死亡者の累積",
+                num_main=deaths,
+                num_sub=deaths_diff),
+            class_="col4-pattern1_left"
+        ),
+        class_="col4-pattern1"
+    )
@@ -0,0 +1,81 @@
+import asyncio
+import io
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import instrumentation
+
+# processes drawing the matplotlib figures of plot_func: pyplot isn't
+# thread-safe and holds the GIL, so it never runs in the app's process
+WORKERS = int(os.environ.get("PLOT_WORKERS", 1))
+MAX_ENTRIES = int(os.environ.get("PLOT_CACHE_ENTRIES", 256))
+
+_pool = None
+_lock = threading.Lock()
+# (key, format) -> image bytes, LRU
+_images: OrderedDict = OrderedDict()
+
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    with _lock:
+        if _pool is None:
+            # spawned, not forked: the app's process has threads (and locks
+            # they may hold) that a fork would copy
+            _pool = ProcessPoolExecutor(
+                WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _draw(figure, args: tuple, fmt: str, dpi: int) -> bytes:
+    # runs in a pool process; the figure is closed whatever happens, so the
+    # process doesn't grow with every plot
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    try:
+        buffer = io.BytesIO()
+        figure(*args).savefig(buffer, format=fmt, dpi=dpi)
+        return buffer.getvalue()
+    finally:
+        # also whatever a figure function that raised had opened
+        plt.close("all")
+
+
+def cached(key: tuple, fmt: str = "png"):
+    with _lock:
+        image = _images.get((key, fmt))
+        if image is not None:
+            _images.move_to_end((key, fmt))
+        return image
+
+
+async def render(key: tuple, figure, args: tuple, fmt: str = "png",
+                 dpi: int = 100) -> bytes:
+    # figure is a module-level plot_func *_figure function and args its
+    # picklable arguments. key names the image, e.g. (function, prefecture,
+    # period, data version); a key rendered before isn't drawn again
+    image = cached(key, fmt)
+    if image is not None:
+        return image
+    loop = asyncio.get_running_loop()
+    with instrumentation.stage("plot", chart=key[0]):
+        image = await loop.run_in_executor(_executor(), _draw, figure, args,
+                                           fmt, dpi)
+    with _lock:
+        _images[(key, fmt)] = image
+        while len(_images) > MAX_ENTRIES:
+            _images.popitem(last=False)
+    return image
+
+
+def shutdown():
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -1,84 +1,87 @@
+import json
+
 import pandas as pd
 import numpy as np
-import altair as alt
 import shiny.ui as ui
 
-from datetime import timedelta
+import chart_payload
+import dataset_store
+import derived_metrics
+import instrumentation
+import lazy_import
+import positivity
+import time_index
+import weekly_detail
 
+# altair (and jsonschema, toolz behind it) loads on the first chart
+alt = lazy_import.lazy_module("altair")
 
-def filter_df_with_daterange(df: pd.DataFrame, plot_range: str):
-    newest = df["Date"].iloc[-1]
-    print(plot_range)
-    if plot_range == "year":
-        oldest = newest - timedelta(days=365)
-    elif plot_range == "3months":
-        oldest = newest - timedelta(days=93)
-    elif plot_range == "month":
-        oldest = newest - timedelta(days=31)
-    elif plot_range == "week":
-        oldest = newest - timedelta(days=7)
-    else:
-        raise TypeError("range must be in [year, 3months, month, week]")
 
-    return df.query(f"Date >= '{oldest.strftime('%Y-%m-%d')}'")
+@instrumentation.timed
+def filter_df_with_daterange(df: pd.DataFrame, plot_range: str, start=None,
+                             end=None):
+    # a preset range, or start to end for time_index.CUSTOM
+    return time_index.select(df, plot_range, start, end)
 
 
-def plot_new_cases(plot_range: str, url: str, ytick_space: int, color: str,
-                   prefecture: str):
-    df = pd.read_csv(url)
-    df["Date"] = pd.to_datetime(df["Date"])
-    df["col"] = color
+def daily_frame(url: str, metric: str = None) -> pd.DataFrame:
+    # a daily dataset, or one of derived_metrics.METRICS computed from it
+    if metric is None:
+        return dataset_store.read(url)
+    return derived_metrics.read(metric, url)
+
 
-    chart = alt.Chart(filter_df_with_daterange(df, plot_range)).mark_area(
+@instrumentation.timed
+def prefecture_series(df: pd.DataFrame, prefecture: str) -> pd.DataFrame:
+    # Date and one prefecture's column out of a date indexed dataset
+    return df[[prefecture]].reset_index()
+
+
+@instrumentation.timed
+def new_cases_chart(df: pd.DataFrame, ytick_space: int, color: str,
+                    prefecture: str):
+    df = chart_payload.reduce_series(df, "Date", prefecture)
+    chart = alt.Chart(df).mark_area(
+        color=color
     ).encode(
-        alt.Y(prefecture, axis=alt.Axis(
+        alt.Y(f"{prefecture}:Q", axis=alt.Axis(
             values=[i*ytick_space for i in range(1, 6, 1)])),
-        x="Date",
-        color=alt.Color("col", scale=None)
+        x="Date:T"
     )
 
     return chart
 
 
+@instrumentation.timed
+def plot_new_cases(plot_range: str, url: str, ytick_space: int, color: str,
+                   prefecture: str, start=None, end=None, metric: str = None):
+    df = prefecture_series(daily_frame(url, metric), prefecture)
+    return new_cases_chart(filter_df_with_daterange(df, plot_range, start, end),
+                           ytick_space=ytick_space,
+                           color=color,
+                           prefecture=prefecture)
+
+
+@instrumentation.timed
 def plot_generation_severe_cases(url: str, prefec_order: int):
-    df = pd.read_csv(url, skiprows=1)
+    cube = weekly_detail.get_cube(url)
 
     # fetch refresh date
-    string_daterange = str(df.iloc[-1, 0])
-    dt_daterefresh = pd.to_datetime(string_daterange.split("~")[1])
+    dt_daterefresh = cube.week_end[-1]
     ui.markdown(f"情報更新日(週次): {dt_daterefresh.strftime('%Y年%m月%d日')}")
 
     # plot
-    def prep_gen(df: pd.DataFrame, color: str):
-        dfc = df.copy()
-        dfc = dfc\
-            .stack()\
-            .to_frame()\
-            .reset_index()\
-            .set_axis(["Week", "Generation", "N"], axis=1)\
-            .assign(N=lambda x: pd.to_numeric(x.N))
-
-        s_gen = [s.split(" ") for s in dfc["Generation"]]
-        dfc["Generation"] = [" ".join(s[1:]) for s in s_gen]
-        dfc["color"] = color
-        dfc["count"] = range(dfc.shape[0])
-        return dfc
-
-    df_male = prep_gen(
-        df.tail(1)
-        .set_index("Week")
-        .iloc[:, 0+(20*prefec_order):10+(20*prefec_order)],
-        color="#5c81c7")
-    df_female = prep_gen(
-        df.tail(1)
-        .set_index("Week")
-        .iloc[:, 10+(20*prefec_order):20+(20*prefec_order)], color="#cf7794")
+    male, female = cube.pyramid(prefec_order)
+    df_male = pd.DataFrame(
+        {"Generation": cube.age_bands, "N": male, "color": "#5c81c7"})
+    df_female = pd.DataFrame(
+        {"Generation": cube.age_bands, "N": female, "color": "#cf7794"})
 
     plt_left = alt.Chart(df_male).mark_bar().encode(
         x=alt.X("N",
                 scale=alt.Scale(reverse=True)),
         y=alt.Y("Generation",
-                sort=df_male["Generation"].to_list()[::-1]),
+                sort=cube.age_bands[::-1]),
         color=alt.Color("color", scale=None)
     ).properties(
         width=180,
@@ -87,7 +90,7 @@ def plot_generation_severe_cases(url: str, prefec_order: int):
     plt_right = alt.Chart(df_female).mark_bar().encode(
         x=alt.X("N",),
         y=alt.Y("Generation",
-                sort=df_male["Generation"].to_list()[::-1]),
+                sort=cube.age_bands[::-1]),
         color=alt.Color("color", scale=None)
     ).properties(
         width=180,
@@ -97,75 +100,49 @@ def plot_generation_severe_cases(url: str, prefec_order: int):
     return alt.hconcat(plt_left, plt_right)
 
 
-def plot_newly_cases_stack(url: str, pref_n: int = 0):
-    import toolz
-    from altair import limit_rows, to_values
-    t = lambda data: toolz.curried.pipe(data, limit_rows(max_rows=10000), to_values)
-    alt.data_transformers.register('custom', t)
-    alt.data_transformers.enable('custom')
-
-    df = pd.read_csv(url, skiprows=1)
-    df = df.iloc[:, [0] + list(range(1 + 20*pref_n, 20 + 20*pref_n, 1))]\
-        .set_index("Week")\
-        .stack()\
-        .to_frame()\
-        .reset_index()
-    df.columns = ["Week", "Generation", "N"]
-    df["Generation"] = df.Generation.str.split(" ", expand=True)\
-        .iloc[:, 1]\
-        .to_list()
-
-    df_merge = pd.merge(
-        df,
-        pd.DataFrame(
-            {"Generation": ["Under", "10s", "20s", "30s", "40s", "50s", "60s", "70s", "80s", "Over"],
-             "Group": ["19歳以下", "19歳以下", "20~59歳", "20~59歳", "20~59歳", "20~59歳", "60歳以上", "60歳以上", "60歳以上", "60歳以上"]}
-        )
-    ).drop("Generation", axis=1)\
-        .replace("*", "0")
-    df_merge["N"] = pd.to_numeric(df_merge.N)
-    df_merge = df_merge\
-        .groupby(["Week", "Group"])\
-        .agg(sum)\
-        .reset_index()
-
-    df_ = df_merge.Week.str.split("~", expand=True)
-    df_.columns = ["week_start", "week_end"]
-    df_merge["week_start"] = pd.to_datetime(df_.week_start)
-    df_merge["week_end"] = pd.to_datetime(df_.week_end)
-
-    chart = alt.Chart(df_merge.iloc[-60:-1, :]).mark_bar(
+@instrumentation.timed
+def plot_newly_cases_stack(url: str, pref_n: int = 0, age_groups: dict = None,
+                           n_weeks: int = 20):
+    cube = weekly_detail.get_cube(url)
+    age_groups = age_groups or weekly_detail.DEFAULT_AGE_GROUPS
+    df = cube.age_group_stack(pref_n, age_groups)
+    # the last n_weeks, or every week a shorter file has
+    df = df[df.week_end >= cube.week_end[-min(n_weeks, len(cube.week_end))]]
+
+    if age_groups is weekly_detail.DEFAULT_AGE_GROUPS:
+        scale = alt.Scale(domain=list(age_groups),
+                          range=["#A6B8CE", "#83BB48", "#863130"])
+    else:
+        scale = alt.Scale(domain=list(age_groups))
+
+    chart = alt.Chart(df).mark_bar(
         width=10).encode(
         x=alt.X("week_end"),
         y="N",
-        color=alt.Color("Group",
-                        scale=alt.Scale(
-                            domain=["19歳以下", "20~59歳", "60歳以上"],
-                            range=["#A6B8CE", "#83BB48", "#863130"]
-                        ))
+        color=alt.Color("Group", scale=scale)
     )
     return chart
 
 
+@instrumentation.timed
 def plot_pcr_org(url: str):
-    df = pd.read_csv(url).iloc[:, :-3]\
-        .set_index("日付")\
-        .stack()\
-        .to_frame()\
-        .reset_index()
-    df.columns = ["Date", "Organization", "N"]
-    df["Date"] = pd.to_datetime(df.Date)
-
-    import toolz
-    from altair import limit_rows, to_values
-    t = lambda data: toolz.curried.pipe(data, limit_rows(max_rows=10000), to_values)
-    alt.data_transformers.register('custom', t)
-    alt.data_transformers.enable('custom')
-
-    chart = alt.Chart(df).mark_area(size=10).encode(
-        x="Date",
-        y="N",
-        color=alt.Color("Organization",
+    df = dataset_store.read(url).reset_index()
+    df = chart_payload.reduce_stacked(df, "Date", width=1000)
+    organizations = [c for c in df.columns if c != "Date"]
+    codes = [str(i) for i in range(len(organizations))]
+
+    # ship the wide frame with short column names and let vega-lite fold it,
+    # so the organization names aren't repeated on every row
+    chart = alt.Chart(
+        df.set_axis(["Date"] + codes, axis=1)
+    ).transform_fold(
+        codes, as_=["code", "N"]
+    ).transform_calculate(
+        Organization=f"{json.dumps(organizations, ensure_ascii=False)}[toNumber(datum.code)]"
+    ).mark_area(size=10).encode(
+        x="Date:T",
+        y="N:Q",
+        color=alt.Color("Organization:N",
                         legend=alt.Legend(
                             legendX=120, legendY=-40,
                             orient="top",
@@ -179,29 +156,12 @@ def plot_pcr_org(url: str):
     return chart
 
 
+@instrumentation.timed
 def plot_positive_rate(url_pcr: str, url_detected: str):
-    df_pcr = pd.read_csv(url_pcr)\
-        .set_axis(["Date", "PCR"], axis=1)
-    df_det = pd.read_csv(url_detected)\
-        .iloc[:, :2]\
-        .set_axis(["Date", "Detection"], axis=1)
-    df_merge = pd.merge(df_pcr, df_det)\
-        .assign(positive_rate=lambda x: x["Detection"] * 100 / x["PCR"])\
-        .assign(positive_rate=lambda x: x["positive_rate"].round(1))\
-        .assign(Date=lambda x: pd.to_datetime(x["Date"]))\
+    df_sum = positivity.get_engine(url_pcr, url_detected).weekly()\
         .assign(PCR=lambda x: x["PCR"] / 100000)
 
-    week_l: list[int] = sum([[i] * 7 for i in range(df_merge.shape[0] // 7)], [])
-    week_l = week_l + [int(week_l[-1]) + 1] * (df_merge.shape[0] % 7 )
-    df_merge["week_n"] = week_l[::-1]
-
-    df_sum = df_merge.groupby("week_n").agg("sum")
-    df_mean = df_merge.groupby("week_n").agg("mean")
-    df_sum["week"] = list(df_merge.Date[::7])[::-1]
-    df_sum["positive_rate"] = df_mean.positive_rate
-
-
-    base = alt.Chart(df_sum.iloc[:-30, :]).encode(
+    base = alt.Chart(df_sum.iloc[30:, :]).encode(
         alt.X("week", axis=alt.Axis(title=None))
     )
 
@@ -222,3 +182,62 @@ def plot_positive_rate(url_pcr: str, url_detected: str):
     )
 
     return chart
+
+
+# derived_metrics the comparison view can show, and their colour scales;
+# ratios are centred on an unchanged week and clamped at double
+COMPARISON_METRICS = {
+    "weekly_per_100k": {"scheme": "reds"},
+    "week_over_week": {"scheme": "redblue", "reverse": True, "domain": [0, 2],
+                       "domainMid": 1, "clamp": True},
+}
+# cells of one comparison heatmap; longer ranges are sampled more sparsely
+COMPARISON_MAX_CELLS = 5000
+
+
+@instrumentation.timed
+def comparison_frame(frame: pd.DataFrame, prefectures: list, plot_range: str,
+                     start=None, end=None) -> pd.DataFrame:
+    # long form d (date), p (prefecture), v (value) of every prefecture at
+    # once; ranges over two months are sampled every week, or every few
+    # weeks to stay within COMPARISON_MAX_CELLS, counting back from the
+    # newest date
+    rows = time_index.span(time_index.dates(frame), plot_range, start, end)
+    days = rows.stop - rows.start
+    step = 1
+    if days > 62:
+        columns = max(COMPARISON_MAX_CELLS // max(len(prefectures), 1), 1)
+        step = 7 * -(-days // (7 * columns))
+    picks = np.arange(rows.stop - 1, rows.start - 1, -step)[::-1]
+    values = frame.to_numpy()[np.ix_(picks, frame.columns.get_indexer(prefectures))]
+    df = pd.DataFrame({
+        "d": np.repeat(frame.index[picks].strftime("%Y-%m-%d"), len(prefectures)),
+        "p": np.tile(prefectures, len(picks)),
+        "v": np.round(values, 2).ravel(),
+    })
+    # no ratio before the first two weeks or after a week without cases
+    return df[np.isfinite(df["v"].to_numpy())]
+
+
+@instrumentation.timed
+def comparison_chart(df: pd.DataFrame, prefectures: list, metric: str):
+    chart = alt.Chart(df).mark_rect().encode(
+        x=alt.X("d:O", title=None, axis=alt.Axis(labelOverlap=True)),
+        y=alt.Y("p:N", title=None, sort=list(prefectures)),
+        color=alt.Color("v:Q", title=None,
+                        scale=alt.Scale(**COMPARISON_METRICS[metric])),
+        tooltip=["d:O", "p:N", "v:Q"]
+    ).properties(
+        width=1000,
+        height=12 * len(prefectures)
+    )
+
+    return chart
+
+
+@instrumentation.timed
+def plot_comparison(prefectures: list, plot_range: str, metric: str,
+                    start=None, end=None):
+    df = comparison_frame(derived_metrics.read(metric), prefectures, plot_range,
+                          start, end)
+    return comparison_chart(df, prefectures, metric)
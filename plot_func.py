@@ -1,34 +1,45 @@
+import functools
+
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from dateutil.relativedelta import relativedelta
-from datetime import datetime
-import altair as alt
 
-import japanize_matplotlib
+import dataset_store
+import endpoints
+import lazy_import
+import time_index
+import weekly_detail
+
+alt = lazy_import.lazy_module("altair")
+
+
+@functools.lru_cache(maxsize=None)
+def _pyplot():
+    # matplotlib, seaborn and the Japanese font lookup load on the first plot;
+    # figures are only ever saved to bytes, never shown
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    import japanize_matplotlib
+
+    sns.set_theme(style='whitegrid', font="IPAexGothic")
+    return plt, sns
 
-sns.set_theme(style='whitegrid', font="IPAexGothic")
 
+# The figures are drawn in two steps: *_data reads the datasets in the app's
+# process, *_figure only draws, from picklable arguments, so plot_backend can
+# run it in a worker process
 
-def convert_period(period:str):
-    if period == "1w":
-        return relativedelta(weeks=1)
-    elif period == "1m":
-        return relativedelta(month=1)
-    elif period == "3m":
-        return relativedelta(months=3)
-    elif period == "12m":
-        return relativedelta(years=1)
-    else:
-        raise TypeError("Unkown period.")
 
+def line_cases_data(url: str, prefec: str, period: str, start=None,
+                    end=None) -> pd.DataFrame:
+    columns = list(dict.fromkeys(["ALL", prefec]))
+    return time_index.select(dataset_store.read(url), period, start, end)[columns]\
+        .reset_index()
 
-def plot_line_cases(url: str, prefec: str, period: str):
-    df = pd.read_csv(url)
-    df["Date"] = pd.to_datetime(df.Date)
-    df_ = df[df.Date > datetime.today() - convert_period(period)]
 
+def line_cases_figure(df_: pd.DataFrame, prefec: str):
+    plt, sns = _pyplot()
     fig, ax = plt.subplots()
     sns.lineplot(data=df_, x="Date", y = "ALL", ax=ax)
     ax.fill_between(df_["Date"], df_[prefec], np.zeros(len(df_.Date)))
@@ -36,32 +47,25 @@ def plot_line_cases(url: str, prefec: str, period: str):
 
     return fig
 
-def plot_piramid(
-    url = "https://covid19.mhlw.go.jp/public/opendata/newly_confirmed_cases_detail_weekly.csv",
-    prefecture_n=1):
 
-    def parse_weekly_data(df: pd.DataFrame, datarange: list):
-        df_ = df.tail(1)\
-            .iloc[:, datarange].reset_index().set_index("Week")\
-            .iloc[:, 1:]\
-            .stack().to_frame().reset_index()\
-            .set_axis(["Week", "Generation", "N"], axis=1)
+def plot_line_cases(url: str, prefec: str, period: str, start=None, end=None):
+    return line_cases_figure(line_cases_data(url, prefec, period, start, end),
+                             prefec)
 
-        df_["N"] = pd.to_numeric(df_["N"])
 
-        s_gen = [s.split(" ") for s in df_["Generation"]]
-        df_["Generation"] = [" ".join(s[1:]) for s in s_gen]
+def piramid_data(url: str = endpoints.NEWLY_CONFIRMED_DETAIL_WEEKLY,
+                 pref_n: int = 0):
+    # male and female counts per age band in the latest week, out of the
+    # shared weekly cube
+    cube = weekly_detail.get_cube(url)
+    return tuple(
+        pd.DataFrame({"Week": cube.week_start[-1], "Generation": cube.age_bands,
+                      "N": counts})
+        for counts in cube.pyramid(pref_n))
 
-        return df_
-
-    i = prefecture_n
-    range_m = [0] + list(range(i, i+10, 1))
-    range_f = [0] + list(range(i+11, i+20, 1))
-
-    df = pd.read_csv(url, skiprows=2)
-    df_male = parse_weekly_data(df, range_m)
-    df_female = parse_weekly_data(df, range_f)
 
+def piramid_figure(df_male: pd.DataFrame, df_female: pd.DataFrame):
+    plt, sns = _pyplot()
     fig, ax = plt.subplots(ncols=2, figsize=(14,6))
 
     sns.barplot(x="N", y="Generation",
@@ -79,31 +83,19 @@ def plot_piramid(
     return fig
 
 
-##############
+def plot_piramid(url: str = endpoints.NEWLY_CONFIRMED_DETAIL_WEEKLY,
+                 pref_n: int = 0):
+    return piramid_figure(*piramid_data(url, pref_n))
 
-def filter_df_with_daterange(df: pd.DataFrame, plot_range: str):
-    newest = df["Date"].iloc[-1]
-    if plot_range == "12m":
-        oldest = newest - relativedelta(days=365)
-    elif plot_range == "3m":
-        oldest = newest - relativedelta(days=93)
-    elif plot_range == "1m":
-        oldest = newest - relativedelta(days=31)
-    elif plot_range == "1w":
-        oldest = newest - relativedelta(days=7)
-    else:
-        raise TypeError("range must be in [year, 3months, month, week]")
-
-    return df.query(f"Date >= '{oldest.strftime('%Y-%m-%d')}'")
 
+##############
 
 def plot_new_cases(plot_range: str, url: str, ytick_space: int, color: str,
                    prefecture: str):
-    df = pd.read_csv(url)
-    df["Date"] = pd.to_datetime(df["Date"])
+    df = time_index.select(dataset_store.read(url), plot_range).reset_index()
     df["col"] = color
 
-    chart = alt.Chart(filter_df_with_daterange(df, plot_range)).mark_area(
+    chart = alt.Chart(df).mark_area(
     ).encode(
         alt.Y(prefecture, axis=alt.Axis(
             values=[i*ytick_space for i in range(1, 6, 1)])),
@@ -0,0 +1,113 @@
+import copy
+import threading
+
+import numpy as np
+import pandas as pd
+
+import dataset_store
+import endpoints
+
+
+class PositivityEngine:
+    # daily PCR counts and detections, with running sums kept up to date as
+    # days are appended. Weeks are counted back from the newest day, as the
+    # dashboard always did: each new day moves every week boundary by one,
+    # and the sums of any week are the difference of two running sums.
+    def __init__(self):
+        self.dates = np.array([], dtype="datetime64[D]")
+        self.pcr = np.array([], dtype=float)
+        self.detection = np.array([], dtype=float)
+        self.rate = np.array([], dtype=float)
+        # sums of the first i days at position i
+        self.cum_pcr = np.zeros(1)
+        self.cum_rate = np.zeros(1)
+
+    def update(self, dates: np.ndarray, pcr: np.ndarray, detection: np.ndarray):
+        n = len(self.dates)
+        if n and len(dates) >= n \
+                and np.array_equal(dates[:n], self.dates) \
+                and np.array_equal(pcr[:n], self.pcr) \
+                and np.array_equal(detection[:n], self.detection):
+            self.append(dates[n:], pcr[n:], detection[n:])
+        else:
+            # history was rewritten upstream, start over
+            self.__init__()
+            self.append(dates, pcr, detection)
+
+    def append(self, dates: np.ndarray, pcr: np.ndarray, detection: np.ndarray):
+        if not len(dates):
+            return
+        rate = np.round(detection * 100 / pcr, 1)
+        # always build new arrays so a reader of the previous state never
+        # sees a half-updated one
+        self.dates = np.concatenate([self.dates, dates])
+        self.pcr = np.concatenate([self.pcr, pcr])
+        self.detection = np.concatenate([self.detection, detection])
+        self.rate = np.concatenate([self.rate, rate])
+        self.cum_pcr = np.concatenate([self.cum_pcr,
+                                       self.cum_pcr[-1] + np.cumsum(pcr)])
+        self.cum_rate = np.concatenate([self.cum_rate,
+                                        self.cum_rate[-1] + np.cumsum(rate)])
+
+    def daily(self) -> pd.DataFrame:
+        return pd.DataFrame({"Date": self.dates, "PCR": self.pcr,
+                             "Detection": self.detection,
+                             "positive_rate": self.rate})
+
+    def weekly(self, include_partial: bool = True) -> pd.DataFrame:
+        # PCR sums and mean positivity of 7-day weeks, the last one ending on
+        # the newest day, labelled by their first day. The oldest week is
+        # short unless the history is a whole number of weeks
+        n = len(self.dates)
+        bounds = np.arange(n, -1, -7)[::-1]
+        if include_partial and len(bounds) and bounds[0]:
+            bounds = np.concatenate([[0], bounds])
+        starts, ends = bounds[:-1], bounds[1:]
+        return pd.DataFrame({
+            "week": self.dates[starts],
+            "PCR": self.cum_pcr[ends] - self.cum_pcr[starts],
+            "positive_rate": (self.cum_rate[ends] - self.cum_rate[starts])
+                             / (ends - starts),
+        })
+
+    def window(self, days: int) -> pd.DataFrame:
+        # mean daily positivity over the trailing `days` days
+        return pd.DataFrame({
+            "Date": self.dates[days - 1:],
+            "positive_rate": (self.cum_rate[days:] - self.cum_rate[:-days]) / days,
+        })
+
+
+def merge_sources(df_pcr: pd.DataFrame, df_detected: pd.DataFrame):
+    # both are date indexed and sorted by their schemas; the first column is
+    # the national count
+    df = pd.concat([df_pcr.iloc[:, 0].rename("PCR"),
+                    df_detected.iloc[:, 0].rename("Detection")],
+                   axis=1, join="inner")
+    return (df.index.to_numpy().astype("datetime64[D]"),
+            df["PCR"].to_numpy(dtype=float),
+            df["Detection"].to_numpy(dtype=float))
+
+
+_lock = threading.Lock()
+_engines: dict = {}
+
+
+def get_engine(url_pcr: str = endpoints.PCR_TESTED,
+               url_detected: str = endpoints.NEWLY_CONFIRMED_DAILY) -> PositivityEngine:
+    # the merge runs once per data version and is shared by every session
+    store = dataset_store.store
+    key = (url_pcr, url_detected)
+    versions = (store.version(url_pcr), store.version(url_detected))
+    cached = _engines.get(key)
+    if cached is not None and cached[0] == versions:
+        return cached[1]
+    with _lock:
+        versions, engine = _engines.get(key, (None, PositivityEngine()))
+        if versions != (store.version(url_pcr), store.version(url_detected)):
+            frames = store.read(url_pcr), store.read(url_detected)
+            versions = (store.version(url_pcr), store.version(url_detected))
+            engine = copy.copy(engine)
+            engine.update(*merge_sources(*frames))
+            _engines[key] = (versions, engine)
+    return engine
@@ -0,0 +1,188 @@
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from urllib.parse import quote
+
+import chart_data
+import chart_registry
+import dataset_store
+import endpoints
+import instrumentation
+import kpi_table
+import lazy_import
+import metrics_box
+import plot_figure
+import positivity
+import snapshot_cache
+import weekly_detail
+
+# every chart and card variant, written per data fingerprint by running this
+# module; unset means the app builds everything itself
+PRERENDER_DIR = os.environ.get("PRERENDER_DIR", "")
+KEEP_VERSIONS = 2
+
+
+def _params_name(params: dict) -> str:
+    return ",".join(f"{key}={quote(str(value), safe='')}"
+                    for key, value in sorted(params.items())) or "default"
+
+
+def _spec_path(root: Path, name: str, params: dict) -> Path:
+    return root / "specs" / name / f"{_params_name(params)}.json"
+
+
+def _card_path(root: Path, prefecture: str) -> Path:
+    return root / "cards" / f"{quote(prefecture, safe='')}.html"
+
+
+def _version_dir():
+    # only files rendered from exactly the data this process holds are used
+    if not PRERENDER_DIR:
+        return None
+    return Path(PRERENDER_DIR) / dataset_store.store.fingerprint(endpoints.ALL)
+
+
+def is_rendered() -> bool:
+    root = _version_dir()
+    return root is not None and root.exists()
+
+
+def load_spec(name: str, params: dict):
+    # the spec as JSON text, sent to the browser as it is
+    root = _version_dir()
+    if root is None:
+        return None
+    try:
+        with instrumentation.stage("prerendered", chart=name):
+            return _spec_path(root, name, params).read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return None
+
+
+def data_dir():
+    # the chart datasets the pre-rendered specs reference
+    root = _version_dir()
+    return None if root is None else root / "data"
+
+
+def load_card(prefecture: str):
+    root = _version_dir()
+    if root is None:
+        return None
+    try:
+        return _card_path(root, prefecture).read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return None
+
+
+def _load_data(snapshots_only: bool = False):
+    # also the pool initializer: forked workers find everything loaded,
+    # spawned ones load it again (from the snapshots when there are some).
+    # snapshots_only renders what the app published and never downloads
+    if snapshots_only:
+        dataset_store.store.ttl = float("inf")
+        missing = [url for url in endpoints.ALL if not dataset_store.store.version(url)]
+        if missing:
+            raise RuntimeError(f"no published snapshot of {', '.join(missing)}")
+    for url in endpoints.ALL:
+        dataset_store.read(url)
+    kpi_table.get_table()
+    weekly_detail.get_cube()
+    positivity.get_engine()
+
+
+def _render(task: tuple) -> int:
+    root, kind, name, params = task
+    if kind == "card":
+        path = _card_path(root, name)
+        data = str(metrics_box.metrics_cards(name)).encode()
+    else:
+        path = _spec_path(root, name, params)
+        # datasets go next to the specs, the app serves them from there
+        chart_data.DIRECTORY = root / "data"
+        data = json.dumps(chart_data.spec(chart_registry.build(name, params)),
+                          ensure_ascii=False).encode()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return len(data)
+
+
+def prerender(out: Path, workers: int = None, force: bool = False,
+              expected: str = None) -> Path:
+    # with expected, the data is the app's published snapshots and must have
+    # that fingerprint
+    snapshots_only = expected is not None
+    if snapshots_only and not snapshot_cache.SNAPSHOT_DIR:
+        raise RuntimeError("rendering the app's data needs SNAPSHOT_DIR")
+    _load_data(snapshots_only)
+    lazy_import.ensure_loaded(plot_figure.alt)
+    fingerprint = dataset_store.store.fingerprint(endpoints.ALL)
+    if snapshots_only and fingerprint != expected:
+        raise RuntimeError(f"the snapshots hold {fingerprint}, not {expected}")
+    final = out / fingerprint
+    if final.exists() and not force:
+        return final
+
+    # rendered into a hidden directory and renamed into place, so the app
+    # never sees a partial version
+    tmp = out / f".{fingerprint}.{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tasks = [(tmp, "card", prefecture, None)
+             for prefecture in chart_registry.PREFECTURES]
+    tasks += [(tmp, "spec", name, params)
+              for name, (variants, _) in chart_registry.CHARTS.items()
+              for params in variants]
+
+    start = time.perf_counter()
+    context = multiprocessing.get_context(
+        "fork" if "fork" in multiprocessing.get_all_start_methods() else None)
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_load_data,
+                             initargs=(snapshots_only,)) as pool:
+        sizes = list(pool.map(_render, tasks, chunksize=8))
+
+    (tmp / "manifest.json").write_text(json.dumps({
+        "fingerprint": fingerprint,
+        "created": time.time(),
+        "seconds": time.perf_counter() - start,
+        "files": len(sizes),
+        "bytes": sum(sizes),
+        "datasets": {url: dataset_store.store.version(url) for url in endpoints.ALL},
+    }, indent=2))
+    shutil.rmtree(final, ignore_errors=True)
+    os.rename(tmp, final)
+
+    versions = sorted((p for p in out.iterdir() if p.is_dir() and not p.name.startswith(".")),
+                      key=lambda p: p.stat().st_mtime, reverse=True)
+    for old in versions[KEEP_VERSIONS:]:
+        shutil.rmtree(old, ignore_errors=True)
+    return final
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="render every chart and card variant for the current data")
+    parser.add_argument("--out", type=Path, default=Path(PRERENDER_DIR or "prerendered"))
+    parser.add_argument("--workers", type=int, default=None,
+                        help="processes to render with, default one per core")
+    parser.add_argument("--force", action="store_true",
+                        help="render again even if this data was already rendered")
+    parser.add_argument("--fingerprint",
+                        help="render the data published in SNAPSHOT_DIR, which "
+                             "must have this fingerprint, instead of downloading it")
+    args = parser.parse_args()
+
+    # next to a running app the snapshots belong to its leader
+    snapshot_cache.read_only = not snapshot_cache.try_lead()
+    args.out.mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    final = prerender(args.out, args.workers, args.force, args.fingerprint)
+    print(f"{final} ({time.perf_counter() - start:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
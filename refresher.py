@@ -0,0 +1,128 @@
+import asyncio
+import os
+import sys
+import traceback
+
+from shiny import reactive, req
+# shiny doesn't export the lock that guards the reactive graph yet
+from shiny.reactive._core import lock
+
+import dataset_store
+import datasets
+import endpoints
+import fetcher
+import prerender
+import snapshot_cache
+
+REFRESH_INTERVAL = float(os.environ.get("DATASET_REFRESH_INTERVAL", 3600))
+# how often a worker that isn't the leader looks for newly published data
+FOLLOW_INTERVAL = float(os.environ.get("DATASET_FOLLOW_INTERVAL", 5))
+
+# one reactive value per endpoint, shared by every session
+_versions = {url: reactive.Value(0) for url in endpoints.ALL}
+_task = None
+_prerender_task = None
+_refresh_callbacks = []
+
+
+def dataset_version(*urls: str) -> tuple:
+    # takes a reactive dependency on the given datasets only, and holds the
+    # caller back until the first version of each has been loaded
+    versions = tuple(_versions[url]() for url in urls)
+    req(all(versions))
+    return versions
+
+
+async def _publish(urls):
+    store = dataset_store.store
+    # looking a version up may load the snapshot from disk
+    versions = await asyncio.to_thread(lambda: [store.version(url) for url in urls])
+    with reactive.isolate():
+        changed = [(url, v) for url, v in zip(urls, versions) if _versions[url]() != v]
+    if changed:
+        async with lock():
+            for url, v in changed:
+                _versions[url].set(v)
+            await reactive.flush()
+
+
+async def _prerender():
+    # the pipeline runs in its own processes and renders the data this worker
+    # published to the snapshots, never a newer download; sessions keep
+    # rendering on demand until it is done
+    fingerprint = await asyncio.to_thread(
+        dataset_store.store.fingerprint, endpoints.ALL)
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, prerender.__file__, "--fingerprint", fingerprint)
+    await process.wait()
+
+
+async def _rebuild_and_publish(urls):
+    # derived tables are rebuilt here, before sessions are told to re-render
+    for fn in _refresh_callbacks:
+        try:
+            await asyncio.to_thread(fn)
+        except Exception:
+            traceback.print_exc()
+    await _publish(urls)
+
+
+async def refresh(urls=endpoints.ALL):
+    errors = await dataset_store.store.arefresh(
+        urls, datasets.READ_OPTIONS, endpoints.APPEND_ONLY)
+    for error in errors:
+        if error is not None:
+            traceback.print_exception(error)
+    await _rebuild_and_publish(urls)
+
+    global _prerender_task
+    if prerender.PRERENDER_DIR and snapshot_cache.SNAPSHOT_DIR \
+            and (_prerender_task is None or _prerender_task.done()) \
+            and not await asyncio.to_thread(prerender.is_rendered):
+        _prerender_task = asyncio.create_task(_prerender())
+
+
+async def follow():
+    # picks up whatever the leader has published since the last call
+    store = dataset_store.store
+    changed = await asyncio.to_thread(
+        lambda: [url for url in endpoints.ALL if store.adopt_snapshot(url)])
+    if changed:
+        await _rebuild_and_publish(changed)
+
+
+async def _refresh_loop():
+    # one worker per snapshot directory downloads, the others follow it and
+    # take over when it goes away
+    leader = snapshot_cache.try_lead()
+    snapshot_cache.read_only = not leader
+    # sessions get the on-disk snapshots while the first refresh is running
+    await _publish(endpoints.ALL)
+    while not leader:
+        await asyncio.sleep(FOLLOW_INTERVAL)
+        await follow()
+        leader = snapshot_cache.try_lead()
+    snapshot_cache.read_only = False
+    while True:
+        await refresh()
+        await asyncio.sleep(REFRESH_INTERVAL)
+
+
+def on_refresh(fn):
+    _refresh_callbacks.append(fn)
+
+
+def start():
+    global _task
+    if _task is None:
+        # the loop owns revalidation, renders only ever read what it has loaded
+        dataset_store.store.ttl = float("inf")
+        _task = asyncio.create_task(_refresh_loop())
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        _task = None
+    await fetcher.aclose()
@@ -0,0 +1,163 @@
+import asyncio
+import os
+from collections import Counter
+
+from shiny import reactive, req
+# shiny doesn't export the lock that guards the reactive graph yet
+from shiny.reactive._core import lock
+
+import lazy_import
+import plot_backend
+import spec_cache
+
+# how long an input has to keep a value before outputs follow it, so
+# scrolling through the prefectures renders only the one the user stops at
+DEBOUNCE_MS = float(os.environ.get("INPUT_DEBOUNCE_MS", 200))
+# charts built at once, each in a thread; the rest wait for a slot
+MAX_BUILDS = int(os.environ.get("MAX_CHART_BUILDS", 2))
+
+# (name, params) -> number of outputs, in any session, currently showing or
+# waiting for that chart. A build nobody wants anymore is skipped
+_wanted = Counter()
+# (name, params) -> the task building it, shared by every session asking
+_builds: dict = {}
+_slots = None
+
+
+def debounce(source, delay_ms: float = DEBOUNCE_MS):
+    # a reactive following source once it has kept a value for delay_ms; the
+    # first value passes straight through so the first render isn't delayed
+    settled = reactive.Value()
+    pending = None
+
+    async def settle(value):
+        await asyncio.sleep(delay_ms / 1000)
+        async with lock():
+            settled.set(value)
+            await reactive.flush()
+
+    @reactive.Effect(priority=1)
+    def _():
+        nonlocal pending
+        value = source()
+        if pending is not None:
+            pending.cancel()
+            pending = None
+        with reactive.isolate():
+            first = not settled.is_set()
+        if first or delay_ms <= 0:
+            settled.set(value)
+        else:
+            pending = asyncio.create_task(settle(value))
+
+    return settled
+
+
+async def _build(key: tuple, run):
+    # run is a coroutine function producing the result, which is also cached
+    # when it can be
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(MAX_BUILDS)
+    async with _slots:
+        # everyone who asked has moved on while it waited for a slot
+        if not _wanted[key]:
+            return None
+        return await run()
+
+
+def _build_in_thread(name: str, params: dict, build_spec) -> str:
+    lazy_import.load_all()
+    return spec_cache.cache.get(name, params, build_spec)
+
+
+class SessionRenders:
+    # widget and image outputs of one session whose spec or image isn't cached
+    # yet return no value and ask for it here. It is built in a thread or the
+    # plot pool, outside the reactive flush, so input events aren't queued
+    # behind it; when it is ready it is handed to the output, which runs
+    # again and takes it, unless the session has asked for another one since.
+    # The hand-off doesn't depend on the cache, which may not have kept it
+    def __init__(self, session):
+        self._wanted: dict = {}
+        self._ready: dict = {}
+        self._errors: dict = {}
+        # output -> (key, result) of a finished build, until the output runs
+        self._results: dict = {}
+        session.on_ended(self._end)
+
+    def _want(self, output: str, key: tuple):
+        old = self._wanted.get(output)
+        if old == key:
+            return
+        if old is not None:
+            _wanted[old] -= 1
+            if _wanted[old] <= 0:
+                del _wanted[old]
+        _wanted[key] += 1
+        self._wanted[output] = key
+
+    def _end(self):
+        for key in self._wanted.values():
+            _wanted[key] -= 1
+            if _wanted[key] <= 0:
+                del _wanted[key]
+        self._wanted = {}
+
+    def widget(self, output: str, name: str, params: dict, build):
+        # build returns an altair chart and runs in a thread, so it must not
+        # read reactive values; read them before and close over the results
+        ready = self._ready.setdefault(output, reactive.Value(0))
+        ready()
+        key = (name, tuple(sorted(params.items())))
+        self._want(output, key)
+        spec = self._take(output, key) or spec_cache.cache.get(name, params)
+        if spec is not None:
+            return spec_cache.from_spec(name, spec)
+        build_spec = spec_cache.spec_builder(name, build)
+        self._later(output, key, lambda: asyncio.to_thread(
+            _build_in_thread, name, params, build_spec))
+
+    def image(self, output: str, key: tuple, figure, args: tuple) -> bytes:
+        # a PNG of a plot_func figure, drawn by plot_backend; key names the
+        # image, args are figure's arguments, read before like build's
+        ready = self._ready.setdefault(output, reactive.Value(0))
+        ready()
+        self._want(output, key)
+        image = self._take(output, key) or plot_backend.cached(key)
+        if image is not None:
+            return image
+        self._later(output, key, lambda: plot_backend.render(key, figure, args))
+
+    def _take(self, output: str, key: tuple):
+        result = self._results.pop(output, None)
+        return result[1] if result is not None and result[0] == key else None
+
+    def _later(self, output: str, key: tuple, run):
+        error = self._errors.pop(key, None)
+        if error is not None:
+            raise error
+        asyncio.create_task(self._wait(output, key, run))
+        # keeps the previous output, shown as recalculating, until it is ready
+        req(False, cancel_output=True)
+
+    async def _wait(self, output: str, key: tuple, run):
+        task = _builds.get(key)
+        if task is None:
+            task = _builds[key] = asyncio.create_task(_build(key, run))
+            task.add_done_callback(lambda _: _builds.pop(key, None))
+        result = None
+        try:
+            # one session going away mustn't cancel the build for the others
+            result = await asyncio.shield(task)
+        except Exception as e:
+            self._errors[key] = e
+        if self._wanted.get(output) != key:
+            return
+        if result is not None:
+            self._results[output] = (key, result)
+        async with lock():
+            ready = self._ready[output]
+            with reactive.isolate():
+                ready.set(ready() + 1)
+            await reactive.flush()
@@ -0,0 +1,207 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from collections import defaultdict
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+# an empty SNAPSHOT_DIR turns the on-disk cache off. Workers sharing one
+# directory share the data: the leader downloads and publishes, the others
+# map what it published. A tmpfs such as /dev/shm keeps it all in memory
+SNAPSHOT_DIR = os.environ.get(
+    "SNAPSHOT_DIR", str(Path(__file__).parent / "snapshots"))
+
+# set in followers, which only ever read what the leader publishes
+read_only = False
+_leader_lock = None
+
+
+def _dataset_dir(url: str) -> Path:
+    return Path(SNAPSHOT_DIR) / hashlib.sha1(url.encode()).hexdigest()[:16]
+
+
+def _write_atomic(path: Path, data: bytes):
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def _current_in(base: Path):
+    try:
+        return base / (base / "current").read_text().strip()
+    except FileNotFoundError:
+        return None
+
+
+def _current(url: str):
+    return _current_in(_dataset_dir(url))
+
+
+def _read_meta(version_dir: Path) -> dict:
+    return json.loads((version_dir / "meta.json").read_text())
+
+
+def current_version(url: str):
+    version_dir = _current(url) if SNAPSHOT_DIR else None
+    return int(version_dir.name[1:]) if version_dir is not None else None
+
+
+def try_lead() -> bool:
+    # an exclusive lock on the directory decides which worker downloads; the
+    # OS releases it when the leader exits, so another worker can take over
+    global _leader_lock
+    if not SNAPSHOT_DIR or fcntl is None or _leader_lock is not None:
+        return True
+    Path(SNAPSHOT_DIR).mkdir(parents=True, exist_ok=True)
+    f = open(Path(SNAPSHOT_DIR) / ".leader", "a")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        f.close()
+        return False
+    _leader_lock = f
+    return True
+
+
+def _publish(base: Path, version_dir: Path):
+    # readers follow "current", so switching it is what publishes the
+    # version. The previous one is kept for readers still loading it
+    previous = _current_in(base)
+    _write_atomic(base / "current", version_dir.name.encode())
+    keep = {version_dir.name, previous.name if previous else None}
+    for old in base.iterdir():
+        if old.is_dir() and old.name not in keep:
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def save_raw(url: str, version: int, body: bytes, etag=None, last_modified=None):
+    # the version is published by save_frame, once it has something parsed
+    if not SNAPSHOT_DIR or read_only:
+        return
+    base = _dataset_dir(url)
+    version_dir = base / f"v{version}"
+    version_dir.mkdir(parents=True, exist_ok=True)
+    _write_atomic(version_dir / "raw.csv", body)
+    meta = {
+        "url": url,
+        "version": version,
+        "etag": etag,
+        "last_modified": last_modified,
+        "saved_at": time.time(),
+        "frames": [],
+    }
+    _write_atomic(version_dir / "meta.json", json.dumps(meta).encode())
+
+
+def save_frame(url: str, version: int, read_kwargs: dict, df: pd.DataFrame):
+    if not SNAPSHOT_DIR or read_only:
+        return
+    base = _dataset_dir(url)
+    version_dir = base / f"v{version}"
+    if not (version_dir / "meta.json").exists():
+        return
+    try:
+        kwargs = json.loads(json.dumps(read_kwargs))
+    except TypeError:
+        return
+
+    meta = _read_meta(version_dir)
+    frame_dir = version_dir / f"f{len(meta['frames'])}"
+    frame_dir.mkdir(exist_ok=True)
+    # numeric columns go into one (columns, rows) array per dtype, which maps
+    # back as a single pandas block without a copy; strings are stored per
+    # column and rebuilt as objects
+    blocks = defaultdict(list)
+    columns = []
+    for i, name in enumerate(df.columns):
+        col = df.iloc[:, i]
+        is_object = not isinstance(col.dtype, np.dtype) or col.dtype == object
+        na = False
+        if is_object:
+            na = col.isna().to_numpy()
+            np.save(frame_dir / f"c{i}.npy", col.fillna("").to_numpy(dtype=str))
+            if na.any():
+                np.save(frame_dir / f"c{i}.na.npy", na)
+            block = None
+        else:
+            block = list(blocks).index(col.dtype.str) if col.dtype.str in blocks \
+                else len(blocks)
+            blocks[col.dtype.str].append(i)
+        columns.append({"name": name, "object": is_object,
+                        "na": bool(np.any(na)), "block": block})
+    for j, indices in enumerate(blocks.values()):
+        np.save(frame_dir / f"b{j}.npy",
+                np.stack([df.iloc[:, i].to_numpy() for i in indices]))
+    # a date index (schema frames) is kept, a default RangeIndex rebuilt
+    index = None
+    if not isinstance(df.index, pd.RangeIndex):
+        np.save(frame_dir / "index.npy", df.index.to_numpy())
+        index = {"name": df.index.name}
+
+    meta["frames"].append({"dir": frame_dir.name, "read_kwargs": kwargs,
+                           "rows": len(df), "columns": columns, "index": index})
+    _write_atomic(version_dir / "meta.json", json.dumps(meta).encode())
+    if _current_in(base) != version_dir:
+        _publish(base, version_dir)
+
+
+def _load_frame(frame_dir: Path, frame: dict) -> pd.DataFrame:
+    # the widest block becomes the frame and stays a read-only view of the
+    # mapped file; everything else is inserted column by column
+    columns = frame["columns"]
+    blocks = {}
+    for col in columns:
+        if col["block"] is not None:
+            blocks.setdefault(col["block"], []).append(col["name"])
+    main = max(blocks, key=lambda j: len(blocks[j]), default=None)
+    if main is None:
+        df = pd.DataFrame(index=pd.RangeIndex(frame["rows"]))
+    else:
+        values = np.load(frame_dir / f"b{main}.npy", mmap_mode="r")
+        df = pd.DataFrame(values.T, columns=blocks[main], copy=False)
+
+    rows_in_block = {j: 0 for j in blocks}
+    for i, col in enumerate(columns):
+        if col["object"]:
+            values = np.load(frame_dir / f"c{i}.npy").astype(object)
+            if col["na"]:
+                values[np.load(frame_dir / f"c{i}.na.npy")] = np.nan
+        else:
+            j = col["block"]
+            row = rows_in_block[j]
+            rows_in_block[j] += 1
+            if j == main:
+                continue
+            values = np.load(frame_dir / f"b{j}.npy", mmap_mode="r")[row]
+        df.insert(i, col["name"], values)
+    if frame.get("index") is not None:
+        df.index = pd.Index(np.load(frame_dir / "index.npy"),
+                            name=frame["index"]["name"])
+    return df
+
+
+def load(url: str):
+    version_dir = _current(url) if SNAPSHOT_DIR else None
+    if version_dir is None:
+        return None
+    try:
+        meta = _read_meta(version_dir)
+        frames = {}
+        for frame in meta["frames"]:
+            key = tuple(sorted(frame["read_kwargs"].items()))
+            frames[key] = _load_frame(version_dir / frame["dir"], frame)
+        meta["frames"] = frames
+        meta["body"] = (version_dir / "raw.csv").read_bytes()
+    except (OSError, ValueError, KeyError):
+        # a snapshot that can't be read is as good as no snapshot
+        return None
+    return meta
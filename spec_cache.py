@@ -0,0 +1,163 @@
+import json
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from vega.widget import VegaWidget
+
+import chart_data
+import dataset_store
+import instrumentation
+import prerender
+
+MAX_ENTRIES = int(os.environ.get("SPEC_CACHE_ENTRIES", 1024))
+MAX_BYTES = int(os.environ.get("SPEC_CACHE_BYTES", 64 * 1024 * 1024))
+
+
+def _labels(key: tuple) -> tuple:
+    # (chart, prefecture, range) metric labels of a cache key: a handful of
+    # values each, however many date ranges or prefecture sets are asked for
+    name, params = key
+    params = dict(params)
+    if "prefectures" in params:
+        prefecture = "all" if params["prefectures"] == "all" else "selection"
+    else:
+        prefecture = params.get("prefecture",
+                                params.get("prefec_order", params.get("pref_n", "")))
+    return (("chart", name), ("prefecture", str(prefecture)),
+            ("range", params.get("range", "")))
+
+
+class SpecCache:
+    # finished Vega-Lite specs, serialized, shared by every session;
+    # LRU-evicted by entry count and size, and emptied whenever any dataset
+    # changes
+    def __init__(self, max_entries: int = MAX_ENTRIES, max_bytes: int = MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict = OrderedDict()
+        self._bytes = 0
+        self._generation = None
+        self._lock = threading.Lock()
+        # by _labels, so there is a bounded number of them
+        self.hits = Counter()
+        self.misses = Counter()
+
+    def _check_generation(self):
+        generation = dataset_store.store.generation
+        if generation != self._generation:
+            self._entries.clear()
+            self._bytes = 0
+            self._generation = generation
+
+    def _in_use(self, key: tuple, cached: tuple) -> bool:
+        # while a spec is served from here, its chart_data files are kept
+        spec, size, files, touched = cached
+        now = time.monotonic()
+        if now - touched < chart_data.TOUCH_INTERVAL:
+            return True
+        if not chart_data.touch(files):
+            return False
+        with self._lock:
+            if self._entries.get(key) is cached:
+                self._entries[key] = (spec, size, files, now)
+        return True
+
+    def get(self, name: str, params: dict, build=None):
+        # build returns the spec as JSON, only called on a miss; without it a
+        # miss returns None
+        key = (name, tuple(sorted(params.items())))
+        with self._lock:
+            self._check_generation()
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+            generation = self._generation
+        if cached is not None and self._in_use(key, cached):
+            with self._lock:
+                self.hits[_labels(key)] += 1
+            return cached[0]
+
+        # the offline pipeline may already have rendered this variant
+        spec = prerender.load_spec(name, params)
+        if spec is None:
+            if build is None:
+                return None
+            spec = build()
+        size = len(spec)
+
+        with self._lock:
+            self.misses[_labels(key)] += 1
+            # don't store a spec built from data that has been replaced since
+            if generation == dataset_store.store.generation and size <= self.max_bytes:
+                old = self._entries.pop(key, None)
+                if old is not None:
+                    self._bytes -= old[1]
+                self._entries[key] = (spec, size, chart_data.references(spec),
+                                      time.monotonic())
+                self._bytes += size
+                while len(self._entries) > self.max_entries \
+                        or self._bytes > self.max_bytes:
+                    _, (_, evicted, _, _) = self._entries.popitem(last=False)
+                    self._bytes -= evicted
+        return spec
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": sum(self.hits.values()),
+                "misses": sum(self.misses.values()),
+                # per (chart, prefecture, range): whether it is warm, and how
+                # often it was served from the cache or built
+                "cached": Counter(_labels(key) for key in self._entries),
+                "hits_by_labels": dict(self.hits),
+                "misses_by_labels": dict(self.misses),
+            }
+
+
+cache = SpecCache()
+
+
+def spec_builder(name: str, build):
+    # build returns an altair chart; the builder returns its spec as JSON
+    def build_spec():
+        chart = build()
+        with instrumentation.stage("spec", chart=name):
+            return json.dumps(chart_data.spec(chart))
+    return build_spec
+
+
+def from_spec(name: str, spec: str) -> VegaWidget:
+    # the datasets are behind chart_data URLs, so the spec is small and
+    # parsing it for VegaWidget, which dumps it again, is cheap
+    with instrumentation.stage("widget", chart=name):
+        return VegaWidget(json.loads(spec))
+
+
+def widget(name: str, params: dict, build) -> VegaWidget:
+    # build returns an altair chart, only called on a miss
+    return from_spec(name, cache.get(name, params, spec_builder(name, build)))
+
+
+def collect_metrics() -> list:
+    stats = cache.stats()
+    return [
+        ("covid_spec_cache_entries", "Specs held in the spec cache",
+         {(): stats["entries"]}),
+        ("covid_spec_cache_bytes", "Serialized size of the cached specs",
+         {(): stats["bytes"]}),
+        ("covid_spec_cache_hits", "Spec cache hits since start", {(): stats["hits"]}),
+        ("covid_spec_cache_misses", "Spec cache misses since start",
+         {(): stats["misses"]}),
+        ("covid_spec_cache_cached", "Specs held per chart, prefecture and range",
+         stats["cached"]),
+        ("covid_spec_cache_chart_hits",
+         "Spec cache hits per chart, prefecture and range since start",
+         stats["hits_by_labels"]),
+        ("covid_spec_cache_chart_misses",
+         "Spec cache misses per chart, prefecture and range since start",
+         stats["misses_by_labels"]),
+    ]
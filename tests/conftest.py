@@ -0,0 +1,9 @@
+import pytest
+
+import snapshot_cache
+
+
+@pytest.fixture(autouse=True)
+def no_snapshots(monkeypatch):
+    # nothing a test loads is published to, or read from, the snapshot dir
+    monkeypatch.setattr(snapshot_cache, "SNAPSHOT_DIR", "")
@@ -0,0 +1,155 @@
+import asyncio
+import gzip
+import json
+import os
+import time
+
+import pytest
+from starlette.requests import Request
+
+import chart_data
+import instrumentation
+import spec_cache
+
+
+@pytest.fixture
+def directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(chart_data, "DIRECTORY", tmp_path)
+    monkeypatch.setattr(chart_data, "fallbacks", [])
+    return tmp_path
+
+
+def _get(name: str, **headers):
+    scope = {"type": "http", "method": "GET", "path_params": {"name": name},
+             "headers": [(key.replace("_", "-").encode(), value.encode())
+                         for key, value in headers.items()]}
+    return asyncio.run(chart_data.endpoint(Request(scope)))
+
+
+def _age(path, seconds: float):
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+def test_save_names_files_by_content(directory):
+    body = b'[{"Date":"2022-01-01","Tokyo":1}]'
+    name = chart_data.save(directory, body)
+    assert name == chart_data.save(directory, body)
+    assert chart_data._NAME.fullmatch(name)
+    assert (directory / name).read_bytes() == body
+    assert gzip.decompress((directory / f"{name}.gz").read_bytes()) == body
+    assert chart_data.save(directory, body + b" ") != name
+    # no temporary files are left behind
+    assert not list(directory.glob(".*"))
+
+
+def test_save_marks_an_existing_file_in_use(directory):
+    name = chart_data.save(directory, b"[]")
+    _age(directory / name, 3600)
+    chart_data.save(directory, b"[]")
+    assert time.time() - (directory / name).stat().st_mtime < 60
+
+
+def test_prune_deletes_only_old_files(directory):
+    old = chart_data.save(directory, b"[1]")
+    new = chart_data.save(directory, b"[2]")
+    _age(directory / old, 100)
+    chart_data.prune(max_age=50)
+    assert not (directory / old).exists()
+    assert not (directory / f"{old}.gz").exists()
+    assert (directory / new).exists()
+    assert (directory / f"{new}.gz").exists()
+
+
+def test_references():
+    spec = json.dumps({"data": {"url": f"chart_data/{'a' * 32}.json"},
+                       "layer": [{"data": {"url": f"chart_data/{'b' * 32}.json"}},
+                                 {"data": {"url": "https://example.com/x.json"}}]})
+    assert chart_data.references(spec) == (f"{'a' * 32}.json", f"{'b' * 32}.json")
+
+
+def test_cached_specs_keep_their_files(directory, monkeypatch):
+    name = chart_data.save(directory, b"[3]")
+    spec = json.dumps({"data": {"url": f"chart_data/{name}"}})
+    cache = spec_cache.SpecCache()
+    builds = []
+
+    def build():
+        builds.append(1)
+        chart_data.save(directory, b"[3]")
+        return spec
+
+    assert cache.get("chart", {}, build) == spec
+    # served from the cache for longer than the files may stay unused
+    monkeypatch.setattr(chart_data, "TOUCH_INTERVAL", 0)
+    _age(directory / name, 100)
+    assert cache.get("chart", {}, build) == spec
+    chart_data.prune(max_age=50)
+    assert (directory / name).exists()
+    assert len(builds) == 1
+
+
+def test_cached_spec_is_rebuilt_when_its_files_are_gone(directory, monkeypatch):
+    name = chart_data.save(directory, b"[4]")
+    spec = json.dumps({"data": {"url": f"chart_data/{name}"}})
+    cache = spec_cache.SpecCache()
+    builds = []
+
+    def build():
+        builds.append(1)
+        chart_data.save(directory, b"[4]")
+        return spec
+
+    cache.get("chart", {}, build)
+    monkeypatch.setattr(chart_data, "TOUCH_INTERVAL", 0)
+    _age(directory / name, 100)
+    chart_data.prune(max_age=50)
+    assert cache.get("chart", {}, build) == spec
+    assert len(builds) == 2
+    assert (directory / name).exists()
+
+
+def test_spec_cache_stats_are_bounded_by_labels(directory, monkeypatch):
+    cache = spec_cache.SpecCache(max_entries=2)
+    for day in range(1, 11):
+        params = {"prefecture": "Tokyo", "range": "custom",
+                  "start": "2022-01-01", "end": f"2022-02-{day:02d}"}
+        cache.get("new_cases", params, lambda: "{}")
+        cache.get("new_cases", params, lambda: "{}")
+    cache.get("comparison", {"prefectures": "Tokyo,Osaka", "range": "year"}, lambda: "{}")
+    stats = cache.stats()
+    tokyo = (("chart", "new_cases"), ("prefecture", "Tokyo"), ("range", "custom"))
+    assert stats["hits_by_labels"] == {tokyo: 10}
+    assert stats["misses"] == 11
+    assert len(stats["misses_by_labels"]) == 2
+    assert stats["cached"] == {
+        tokyo: 1,
+        (("chart", "comparison"), ("prefecture", "selection"), ("range", "year")): 1}
+
+    monkeypatch.setattr(spec_cache, "cache", cache)
+    monkeypatch.setattr(instrumentation, "_collectors", [spec_cache.collect_metrics])
+    lines = instrumentation.render_metrics().splitlines()
+    assert 'covid_spec_cache_chart_hits{chart="new_cases",prefecture="Tokyo",range="custom"} 10' in lines
+
+
+def test_endpoint_compares_etags_exactly(directory):
+    name = chart_data.save(directory, b'[{"Tokyo":1}]')
+    etag = f'"{name[:-len(".json")]}"'
+    assert _get(name, if_none_match=etag).status_code == 304
+    assert _get(name, if_none_match=f'"x", W/{etag}').status_code == 304
+    assert _get(name, if_none_match="*").status_code == 304
+    # a tag containing this one isn't it
+    assert _get(name, if_none_match=f'"a{etag[1:]}').status_code == 200
+    assert _get(name, if_none_match=etag[1:-1]).status_code == 200
+
+
+def test_endpoint_honours_q_zero(directory):
+    body = b'[{"Tokyo":1}]' * 100
+    name = chart_data.save(directory, body)
+    assert _get(name, accept_encoding="gzip").headers["content-encoding"] == "gzip"
+    for refused in ["gzip;q=0", "gzip; q=0.0, br;q=0", "*;q=0", "identity"]:
+        response = _get(name, accept_encoding=refused)
+        assert "content-encoding" not in response.headers
+        assert response.body == body
+    assert _get(name, accept_encoding="*").headers["content-encoding"] \
+        in chart_data.ENCODINGS
@@ -0,0 +1,27 @@
+import numpy as np
+import pandas as pd
+
+import chart_payload
+
+
+def _series(days: int) -> pd.DataFrame:
+    # a smooth wave with one spike on top
+    cases = (500 + 400 * np.sin(np.arange(days) / 20)).astype(int)
+    cases[days // 3] = 5000
+    return pd.DataFrame({"Date": pd.date_range("2022-01-01", periods=days),
+                         "Tokyo": cases, "Osaka": 0})
+
+
+def test_year_is_downsampled_keeping_the_ends_and_the_spike():
+    df = _series(365)
+    out = chart_payload.reduce_series(df, "Date", "Tokyo")
+    assert list(out.columns) == ["Date", "Tokyo"]
+    assert len(out) == chart_payload.CHART_WIDTH // 2
+    assert out["Date"].iloc[0] == "2022-01-01"
+    assert out["Date"].iloc[-1] == "2022-12-31"
+    assert out["Tokyo"].max() == df["Tokyo"].max()
+
+
+def test_short_ranges_keep_every_row():
+    out = chart_payload.reduce_series(_series(93), "Date", "Tokyo")
+    assert len(out) == 93
@@ -0,0 +1,64 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import chart_data
+import chart_registry
+import derived_metrics
+import plot_figure
+import time_index
+
+PREFECTURES = chart_registry.PREFECTURES[1:]
+
+
+def _metric(days: int) -> pd.DataFrame:
+    # a derived_metrics table over every prefecture, NaN for the first week
+    rng = np.random.default_rng(0)
+    counts = pd.DataFrame(rng.integers(0, 500, (days, len(PREFECTURES) + 1)),
+                          index=pd.date_range("2020-01-16", periods=days, name="Date"),
+                          columns=chart_registry.PREFECTURES)
+    return derived_metrics.weekly_per_100k(counts)
+
+
+def test_short_ranges_keep_every_day():
+    frame = _metric(400)
+    df = plot_figure.comparison_frame(frame, ["Tokyo", "Osaka"], "month")
+    assert df["d"].nunique() == 32
+    assert df["d"].iloc[-1] == "2021-02-18"
+    tokyo = df[df["p"] == "Tokyo"].set_index("d")["v"]
+    assert tokyo["2021-02-01"] == round(frame.loc["2021-02-01", "Tokyo"], 2)
+
+
+def test_long_ranges_are_sampled_weekly_from_the_newest_date():
+    frame = _metric(400)
+    df = plot_figure.comparison_frame(frame, PREFECTURES, "year")
+    dates = pd.to_datetime(df["d"].unique())
+    assert dates[-1] == frame.index[-1]
+    assert (np.diff(dates) == np.timedelta64(7, "D")).all()
+    assert len(df) == len(dates) * len(PREFECTURES)
+
+
+def test_the_first_week_has_no_value():
+    df = plot_figure.comparison_frame(_metric(400), ["Tokyo"], time_index.CUSTOM)
+    assert np.isfinite(df["v"]).all()
+    assert df["d"].iloc[0] >= "2020-01-22"
+
+
+@pytest.mark.parametrize("prefectures", [PREFECTURES, ["Tokyo", "Osaka"]])
+def test_full_history_stays_within_the_cell_limit(prefectures, tmp_path, monkeypatch):
+    monkeypatch.setattr(chart_data, "DIRECTORY", tmp_path)
+    frame = _metric(1300)
+    df = plot_figure.comparison_frame(frame, prefectures, time_index.CUSTOM,
+                                      "2020-01-16", "2023-08-07")
+    assert len(df) <= plot_figure.COMPARISON_MAX_CELLS
+    dates = pd.to_datetime(df["d"].unique())
+    assert dates[-1] == frame.index[-1]
+    assert len(np.unique(np.diff(dates))) == 1
+    assert np.diff(dates)[0] % np.timedelta64(7, "D") == 0
+
+    # altair accepts it, and the data goes to a chart_data file
+    spec = chart_data.spec(plot_figure.comparison_chart(df, prefectures, "weekly_per_100k"))
+    url = spec["data"]["url"]
+    assert json.loads((tmp_path / url.split("/")[-1]).read_text())[-1]["d"] == "2023-08-07"
@@ -0,0 +1,93 @@
+import asyncio
+
+import pandas as pd
+
+import dataset_store
+import fetcher
+
+URL = "http://example.invalid/newly_confirmed_cases_daily.csv"
+BODY = b"Date,ALL,Tokyo\n2022/1/1,10,1\n2022/1/2,20,2\n2022/1/3,30,3\n"
+SCHEMA = {"schema": "daily_counts"}
+
+
+def _loaded(body: bytes = BODY) -> dataset_store.DatasetStore:
+    store = dataset_store.DatasetStore(ttl=float("inf"), full_fetch_every=2)
+    store._apply(store._entry(URL), 200, body, '"v1"', None)
+    store.read_csv(URL, **SCHEMA)
+    return store
+
+
+def test_append_tail_extends_the_parsed_frame():
+    store = _loaded()
+    entry = store._entry(URL)
+    tail = b"2022/1/3,30,3\n2022/1/4,40,4\n2022/1/5,50,5\n"
+    assert store._append_tail(entry, tail, '"v2"', None)
+
+    assert entry.version == 2
+    assert entry.etag == '"v2"'
+    assert entry.body == BODY + b"2022/1/4,40,4\n2022/1/5,50,5\n"
+    df = store.read_csv(URL, **SCHEMA)
+    assert list(df["ALL"]) == [10, 20, 30, 40, 50]
+    assert df.index[-1] == pd.Timestamp("2022-01-05")
+    # the same frame a full parse of the new body gives
+    pd.testing.assert_frame_equal(df, dataset_store._parse(entry.body, SCHEMA))
+
+
+def test_append_tail_without_new_rows_keeps_the_version():
+    store = _loaded()
+    entry = store._entry(URL)
+    assert store._append_tail(entry, b"2022/1/3,30,3\n", '"v1"', None)
+    assert entry.version == 1
+
+
+def test_append_tail_rejects_rows_that_are_not_later():
+    store = _loaded()
+    entry = store._entry(URL)
+    assert not store._append_tail(entry, b"2022/1/3,30,3\n2022/1/2,25,2\n", '"v2"', None)
+    assert entry.version == 1
+    assert entry.body == BODY
+
+
+def test_full_fetch_every_n_refreshes_picks_up_revised_rows(monkeypatch):
+    # upstream appends a day on every request, and corrected 2022/1/1 once
+    files = [BODY]
+    full_requests = []
+
+    def upstream():
+        body = files[-1] + f"2022/1/{len(files) + 3},1,1\n".encode()
+        if len(files) == 2:
+            body = body.replace(b"2022/1/1,10,1", b"2022/1/1,11,1")
+        files.append(body)
+        return body
+
+    async def fetch_many(requests):
+        body = upstream()
+        head, tail = (headers["Range"][len("bytes="):].split("-") for _, headers in requests)
+        return [(206, body[:int(head[1]) + 1], None, None),
+                (206, body[int(tail[0]):], f'"v{len(files)}"', None)]
+
+    async def fetch(url, headers=None):
+        full_requests.append(headers)
+        return (200, upstream(), f'"v{len(files)}"', None)
+
+    monkeypatch.setattr(fetcher, "fetch_many", fetch_many)
+    monkeypatch.setattr(fetcher, "fetch", fetch)
+    store = _loaded()
+
+    def refresh():
+        errors = asyncio.run(store.arefresh([URL], {URL: SCHEMA}, {URL}))
+        assert errors == [None]
+        return store.read_csv(URL, **SCHEMA)
+
+    # two appends: the revision made upstream on the second is not seen
+    assert refresh()["ALL"].iloc[0] == 10
+    assert refresh()["ALL"].iloc[0] == 10
+    assert not full_requests
+    # the third refresh downloads the whole file, conditionally
+    df = refresh()
+    assert full_requests == [{"If-None-Match": '"v3"'}]
+    assert df["ALL"].iloc[0] == 11
+    pd.testing.assert_frame_equal(df, dataset_store._parse(files[-1], SCHEMA))
+    # and the next one is an append again
+    refresh()
+    assert len(full_requests) == 1
@@ -0,0 +1,64 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+import datasets
+
+
+def test_daily_counts():
+    body = b"Date,ALL,Tokyo\r\n2022/1/1,10,1\r\n2022/1/2,20,2\r\n"
+    df = datasets.parse("daily_counts", body)
+    assert list(df.columns) == ["ALL", "Tokyo"]
+    assert df.index.name == "Date"
+    assert list(df.index) == [pd.Timestamp("2022-01-01"), pd.Timestamp("2022-01-02")]
+    assert (df.dtypes == np.int32).all()
+    assert df["ALL"].tolist() == [10, 20]
+
+
+def test_rows_are_sorted_by_date():
+    body = b"Date,ALL\n2022/1/3,30\n2022/1/1,10\n2022/1/2,20\n"
+    df = datasets.parse("daily_counts", body)
+    assert df.index.is_monotonic_increasing
+    assert df["ALL"].tolist() == [10, 20, 30]
+
+
+def test_quoted_and_blank_cells_fall_back_to_read_csv():
+    body = b'Date,ALL,Tokyo\n"2022/1/1","1000",\n2022/1/2,5.0,2\n'
+    df = datasets.parse("daily_counts", body)
+    assert df["ALL"].tolist() == [1000, 5]
+    # blank counts are zero
+    assert df["Tokyo"].tolist() == [0, 2]
+    assert (df.dtypes == np.int32).all()
+
+
+def test_weekly_detail():
+    body = (b",Tokyo,Tokyo,Osaka\n"
+            b"Week,Male,Female,Male\n"
+            b"2022/01/03~2022/01/09,1,*,3\n"
+            b"2022/01/10~2022/01/16,4,5,*\n")
+    df = datasets.parse("weekly_detail", body)
+    assert list(df.columns) == ["Male", "Female", "Male.1"]
+    assert list(df.index) == [pd.Timestamp("2022-01-03"), pd.Timestamp("2022-01-10")]
+    assert df.dtypes.unique().tolist() == [np.float32]
+    assert np.isnan(df.iloc[0, 1]) and np.isnan(df.iloc[1, 2])
+    assert df.iloc[1, 0] == 4
+
+
+def test_pcr_case_drops_the_trailing_columns():
+    body = b"Date,A,B,C,D,E\n2022/1/1,1,2,3,4,5\n"
+    df = datasets.parse("pcr_case", body)
+    assert list(df.columns) == ["A", "B"]
+
+
+def test_header_only():
+    df = datasets.parse("daily_counts", b"Date,ALL,Tokyo\n")
+    assert df.shape == (0, 2)
+    assert df.index.name == "Date"
+
+
+def test_column_names_match_read_csv():
+    for header in [b"Date,,ALL,ALL,ALL\n", b"Date,ALL,ALL,ALL.1\n",
+                   b"a,a.1,a,a\n", b"\xef\xbb\xbfWeek,Male,Female,Male,Female\r\n"]:
+        assert datasets._column_names(header) == list(
+            pd.read_csv(io.BytesIO(header)).columns)
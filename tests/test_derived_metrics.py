@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+import dataset_store
+import derived_metrics
+import endpoints
+
+
+def _counts(days: int = 21, scale: int = 1) -> pd.DataFrame:
+    index = pd.date_range("2022-01-01", periods=days, name="Date")
+    return pd.DataFrame({"ALL": np.arange(days) * scale, "Tokyo": np.full(days, scale)},
+                        index=index, dtype="int32")
+
+
+def _csv(df: pd.DataFrame) -> bytes:
+    return df.to_csv(date_format="%Y/%m/%d").encode()
+
+
+def test_rolling_metrics():
+    counts = _counts()
+    rolling = derived_metrics.rolling_mean(counts)
+    assert rolling["Tokyo"].isna().sum() == 6
+    assert rolling["ALL"].iloc[6] == 3
+    weekly = derived_metrics.weekly_per_100k(counts)
+    assert np.isclose(weekly["Tokyo"].iloc[-1],
+                      round(7 * 100_000 / derived_metrics.POPULATION["Tokyo"], 2))
+    ratio = derived_metrics.week_over_week(counts)
+    assert ratio["Tokyo"].iloc[-1] == 1
+    assert np.isnan(ratio["Tokyo"].iloc[12])
+    assert ratio["ALL"].iloc[13] == (7 + 8 + 9 + 10 + 11 + 12 + 13) / (0 + 1 + 2 + 3 + 4 + 5 + 6)
+
+
+def test_read_derives_from_the_given_url(monkeypatch):
+    store = dataset_store.DatasetStore(ttl=float("inf"))
+    for url, scale in [(endpoints.NEWLY_CONFIRMED_DAILY, 1), (endpoints.SEVERE_DAILY, 10)]:
+        store._apply(store._entry(url), 200, _csv(_counts(scale=scale)), None, None)
+    monkeypatch.setattr(dataset_store, "store", store)
+    monkeypatch.setattr(derived_metrics, "_cache", {})
+
+    daily = derived_metrics.read("rolling_7d")
+    severe = derived_metrics.read("rolling_7d", endpoints.SEVERE_DAILY)
+    assert daily["Tokyo"].iloc[-1] == 1
+    assert severe["Tokyo"].iloc[-1] == 10
+    assert derived_metrics.read("rolling_7d") is daily
+
+    # a new version of the counts is derived again
+    store._apply(store._entry(endpoints.NEWLY_CONFIRMED_DAILY), 200,
+                 _csv(_counts(scale=2)), None, None)
+    assert derived_metrics.read("rolling_7d")["Tokyo"].iloc[-1] == 2
+    assert derived_metrics.read("rolling_7d", endpoints.SEVERE_DAILY) is severe
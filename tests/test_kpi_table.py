@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+import derived_metrics
+import kpi_table
+
+
+def _frame(values: dict, days: int = 30) -> pd.DataFrame:
+    index = pd.date_range("2022-01-01", periods=days, name="Date")
+    return pd.DataFrame(values, index=index)
+
+
+def test_diffs_are_latest_minus_previous():
+    days = 30
+    daily = _frame({"ALL": np.arange(days) * 100, "Tokyo": np.arange(days)[::-1] * 10})
+    severe = _frame({"ALL": np.arange(days), "Tokyo": np.full(days, 5)})
+    deaths = _frame({"ALL": np.arange(days) * 2, "Tokyo": np.arange(days)})
+    table = kpi_table.compute_kpi_table(daily, severe, deaths)
+
+    assert table.loc["ALL", "new_cases"] == 2900
+    assert table.loc["ALL", "new_cases_diff"] == 100
+    assert table.loc["Tokyo", "new_cases_diff"] == -10
+    assert table.loc["Tokyo", "severe_cases_diff"] == 0
+    assert table.loc["ALL", "deaths_diff"] == 2
+    assert table.loc["Tokyo", "cumulative_cases"] == daily["Tokyo"].sum()
+    # the week before the latest day
+    assert table.loc["ALL", "week_average_0"] == daily["ALL"].iloc[-8:-1].mean()
+    assert table.loc["ALL", "week_average_1"] == daily["ALL"].iloc[-15:-8].mean()
+
+
+def test_per100k_diff_has_the_sign_of_the_other_diffs():
+    daily = _frame({"ALL": [0] * 28 + [100_000, 300_000], "Tokyo": [0] * 29 + [14_000]})
+    table = kpi_table.compute_kpi_table(daily, daily, daily)
+
+    population = derived_metrics.POPULATION["ALL"]
+    expected = round(300_000 * 100_000 / population, 2) - round(100_000 * 100_000 / population, 2)
+    assert table.loc["ALL", "per100k_diff"] > 0
+    assert np.isclose(table.loc["ALL", "per100k_diff"], expected)
+    assert table.loc["Tokyo", "per100k_diff"] == table.loc["Tokyo", "per100k"] > 0
+    assert np.sign(table.loc["ALL", "per100k_diff"]) == np.sign(table.loc["ALL", "new_cases_diff"])
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import positivity
+
+
+def _days(n: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    dates = np.arange(np.datetime64("2020-02-05"), np.datetime64("2020-02-05") + n)
+    pcr = rng.integers(1000, 5000, n).astype(float)
+    detection = np.floor(pcr * rng.uniform(0.01, 0.2, n))
+    return dates, pcr, detection
+
+
+def _baseline(dates, pcr, detection) -> pd.DataFrame:
+    # the dashboard's original groupby: weeks of 7 rows counted back from the
+    # newest day, the remainder forming the oldest week
+    df = pd.DataFrame({"Date": dates, "PCR": pcr, "Detection": detection})\
+        .assign(positive_rate=lambda x: (x["Detection"] * 100 / x["PCR"]).round(1))
+    week_n = np.arange(len(df))[::-1] // 7
+    grouped = df.assign(week_n=week_n).groupby("week_n")
+    return pd.DataFrame({"week": grouped["Date"].min(),
+                         "PCR": grouped["PCR"].sum(),
+                         "positive_rate": grouped["positive_rate"].mean()})\
+        .iloc[::-1].reset_index(drop=True)
+
+
+@pytest.mark.parametrize("n", [7, 30, 365, 368])
+def test_weekly_matches_the_baseline_groupby(n):
+    engine = positivity.PositivityEngine()
+    engine.update(*_days(n))
+    weekly = engine.weekly()
+    expected = _baseline(*_days(n))
+    assert weekly["week"].iloc[-1] == pd.Timestamp("2020-02-05") + pd.Timedelta(days=n - 7)
+    np.testing.assert_array_equal(weekly["week"].to_numpy(), expected["week"].to_numpy())
+    np.testing.assert_allclose(weekly["PCR"], expected["PCR"])
+    np.testing.assert_allclose(weekly["positive_rate"], expected["positive_rate"])
+
+
+def test_appending_days_moves_the_weeks():
+    dates, pcr, detection = _days(400)
+    engine = positivity.PositivityEngine()
+    engine.update(dates[:390], pcr[:390], detection[:390])
+    for end in range(391, 401):
+        engine.update(dates[:end], pcr[:end], detection[:end])
+        weekly = engine.weekly()
+        expected = _baseline(dates[:end], pcr[:end], detection[:end])
+        np.testing.assert_allclose(weekly["PCR"], expected["PCR"])
+        np.testing.assert_allclose(weekly["positive_rate"], expected["positive_rate"])
+    assert engine.weekly(include_partial=False)["week"].iloc[0] == pd.Timestamp(dates[400 % 7])
+
+
+def test_rewritten_history_starts_over():
+    dates, pcr, detection = _days(60)
+    engine = positivity.PositivityEngine()
+    engine.update(dates, pcr, detection)
+    pcr = pcr.copy()
+    pcr[3] += 1
+    engine.update(dates, pcr, detection)
+    np.testing.assert_allclose(engine.weekly()["PCR"], _baseline(dates, pcr, detection)["PCR"])
+
+
+def test_window():
+    dates, pcr, detection = _days(30)
+    engine = positivity.PositivityEngine()
+    engine.update(dates, pcr, detection)
+    window = engine.window(7)
+    assert len(window) == 24
+    assert np.isclose(window["positive_rate"].iloc[-1], engine.rate[-7:].mean())
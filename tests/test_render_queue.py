@@ -0,0 +1,51 @@
+import asyncio
+from collections import Counter
+
+import pytest
+from shiny import reactive
+from shiny.types import SilentCancelOutputException
+
+import render_queue
+import spec_cache
+
+
+class _Session:
+    def on_ended(self, callback):
+        pass
+
+
+def test_build_reaches_the_output_when_the_cache_drops_it(monkeypatch):
+    # a spec larger than the cache is never stored, yet the output waiting
+    # for it must get it rather than build it again
+    monkeypatch.setattr(spec_cache, "cache", spec_cache.SpecCache(max_bytes=1))
+    monkeypatch.setattr(spec_cache, "from_spec", lambda name, spec: spec)
+    monkeypatch.setattr(spec_cache, "spec_builder",
+                        lambda name, build: lambda: build())
+    monkeypatch.setattr(render_queue, "_slots", None)
+    monkeypatch.setattr(render_queue, "_wanted", Counter())
+    monkeypatch.setattr(render_queue, "_builds", {})
+    builds = []
+
+    def build():
+        builds.append(1)
+        return '{"mark": "line"}'
+
+    async def main():
+        renders = render_queue.SessionRenders(_Session())
+
+        def render():
+            # as the output would, outside of it
+            with reactive.isolate():
+                return renders.widget("plot", "new_cases", {"pref": 1}, build)
+
+        with pytest.raises(SilentCancelOutputException):
+            render()
+        while "plot" not in renders._results:
+            await asyncio.sleep(0.01)
+        assert render() == '{"mark": "line"}'
+        # taken once; a later run without a cached spec builds again
+        with pytest.raises(SilentCancelOutputException):
+            render()
+
+    asyncio.run(main())
+    assert builds == [1]
@@ -0,0 +1,71 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import time_index
+
+
+def _daily(days: int = 400) -> pd.DataFrame:
+    index = pd.date_range("2021-01-01", periods=days, name="Date")
+    return pd.DataFrame({"ALL": np.arange(days)}, index=index)
+
+
+@pytest.mark.parametrize("plot_range, days", [
+    ("week", 7), ("month", 31), ("3months", 93), ("year", 365), ("1m", 31), ("12m", 365)])
+def test_presets_count_back_from_the_newest_date(plot_range, days):
+    df = _daily()
+    view = time_index.select(df, plot_range)
+    last = df.index[-1]
+    # the day the preset counts back to is included, as the boolean filter did
+    assert view.index[0] == last - pd.Timedelta(days=days)
+    assert view.index[-1] == last
+    pd.testing.assert_frame_equal(view, df[df.index >= last - pd.Timedelta(days=days)])
+
+
+def test_presets_on_a_column():
+    df = _daily().reset_index()
+    view = time_index.select(df, "week")
+    assert len(view) == 8
+    assert view["Date"].iloc[-1] == df["Date"].iloc[-1]
+
+
+def test_custom_range_includes_both_ends():
+    view = time_index.select(_daily(), time_index.CUSTOM, "2021-02-01", "2021-02-10")
+    assert view.index[0] == pd.Timestamp("2021-02-01")
+    assert view.index[-1] == pd.Timestamp("2021-02-10")
+    assert len(view) == 10
+
+
+def test_custom_range_open_ends_and_gaps():
+    df = _daily()
+    assert len(time_index.select(df, time_index.CUSTOM, None, "2021-01-05")) == 5
+    assert len(time_index.select(df, time_index.CUSTOM, "2022-02-01", None)) == 4
+    assert len(time_index.select(df, time_index.CUSTOM, "2030-01-01", "2031-01-01")) == 0
+    # dates given as datetime.date, as the date range input sends them
+    span = time_index.span(time_index.dates(df), time_index.CUSTOM,
+                           datetime.date(2020, 1, 1), datetime.date(2021, 1, 3))
+    assert span == slice(0, 3)
+
+
+def test_select_returns_a_view():
+    df = _daily()
+    view = time_index.select(df, "month")
+    assert np.shares_memory(view.to_numpy(), df.to_numpy())
+
+
+def test_empty_frame_and_unknown_range():
+    empty = _daily(0)
+    assert len(time_index.select(empty, "year")) == 0
+    with pytest.raises(TypeError):
+        time_index.select(_daily(), "decade")
+
+
+def test_picker_bounds():
+    bounds = time_index.picker_bounds(time_index.dates(_daily()))
+    assert bounds == {"start": datetime.date(2021, 11, 3),
+                      "end": datetime.date(2022, 2, 4),
+                      "min": datetime.date(2021, 1, 1),
+                      "max": datetime.date(2022, 2, 4)}
+    assert time_index.picker_bounds(time_index.dates(_daily(0))) == {}
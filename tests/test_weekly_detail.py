@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+
+import plot_figure
+import weekly_detail
+
+AGE_BANDS = ["Under 10", "10s", "20s", "30s", "40s", "50s", "60s", "70s", "80s", "Over 90"]
+
+
+def _cube(weeks: int, prefectures: int = 2) -> weekly_detail.WeeklyCube:
+    columns = [f"{sex} {band}" for _ in range(prefectures)
+               for sex in weekly_detail.SEXES for band in AGE_BANDS]
+    values = np.arange(weeks * len(columns), dtype=float).reshape(weeks, len(columns))
+    values[0, 3] = np.nan
+    index = pd.date_range("2022-01-06", periods=weeks, freq="7D", name="Date")
+    return weekly_detail.WeeklyCube.from_frame(pd.DataFrame(values, index=index,
+                                                            columns=columns))
+
+
+def test_cube_layout():
+    cube = _cube(3)
+    assert cube.age_bands == AGE_BANDS
+    assert cube.week_end[0] == pd.Timestamp("2022-01-12")
+    male, female = cube.pyramid(1)
+    assert male[0] == 2 * 40 + 20 and female[-1] == 2 * 40 + 39
+    stack = cube.age_group_stack(0)
+    first = stack[(stack.week_start == "2022-01-06") & (stack.Group == "19歳以下")]
+    # the suppressed cell counts as zero
+    assert first["N"].item() == 0 + 1 + 10 + 11
+
+
+def test_stack_chart_with_fewer_weeks_than_asked_for(monkeypatch):
+    cube = _cube(5)
+    monkeypatch.setattr(weekly_detail, "get_cube", lambda url: cube)
+    chart = plot_figure.plot_newly_cases_stack("weekly", pref_n=1, n_weeks=20)
+    assert chart.data["week_end"].nunique() == 5
+    chart = plot_figure.plot_newly_cases_stack("weekly", pref_n=1, n_weeks=2)
+    assert chart.data["week_end"].nunique() == 2
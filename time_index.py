@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+
+# the グラフ表示期間 presets, as days back from the newest date
+PRESETS = {"year": 365, "3months": 93, "month": 31, "week": 7}
+# plot_func's names for the same presets
+ALIASES = {"12m": "year", "3m": "3months", "1m": "month", "1w": "week"}
+# a range picked on the client, given by its start and end dates
+CUSTOM = "custom"
+
+
+def dates(df: pd.DataFrame) -> np.ndarray:
+    # the sorted dates of a frame, from its Date column or its date index,
+    # without a copy
+    if "Date" in df.columns:
+        return df["Date"].to_numpy()
+    return df.index.to_numpy()
+
+
+def _datetime64(value):
+    return None if value is None else pd.Timestamp(value).to_datetime64()
+
+
+def span(dates: np.ndarray, plot_range: str = CUSTOM, start=None,
+         end=None) -> slice:
+    # positions of the rows from start to end, both included, found by binary
+    # search over the dates; a preset counts back from the newest date. A
+    # missing start or end leaves that side open
+    if plot_range == CUSTOM:
+        start, end = _datetime64(start), _datetime64(end)
+    else:
+        days = PRESETS.get(ALIASES.get(plot_range, plot_range))
+        if days is None:
+            raise TypeError(f"range must be in {list(PRESETS)} or {CUSTOM}")
+        if not len(dates):
+            return slice(0, 0)
+        start, end = dates[-1] - np.timedelta64(days, "D"), None
+    i = 0 if start is None else int(np.searchsorted(dates, start, "left"))
+    j = len(dates) if end is None else int(np.searchsorted(dates, end, "right"))
+    return slice(i, j)
+
+
+def select(df: pd.DataFrame, plot_range: str = CUSTOM, start=None,
+           end=None) -> pd.DataFrame:
+    # the rows in range, as a view of df
+    return df.iloc[span(dates(df), plot_range, start, end)]
+
+
+def picker_bounds(dates: np.ndarray, plot_range: str = "3months") -> dict:
+    # start, end, min and max of a date range input over these dates: the
+    # preset's span to begin with, and nothing outside the data
+    if not len(dates):
+        return {}
+    first, last = (pd.Timestamp(d).date() for d in (dates[0], dates[-1]))
+    start = pd.Timestamp(dates[span(dates, plot_range)][0]).date()
+    return {"start": start, "end": last, "min": first, "max": last}
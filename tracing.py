@@ -0,0 +1,48 @@
+import functools
+import logging
+import os
+import time
+
+from shiny import reactive
+from shiny.session import get_current_session
+
+logger = logging.getLogger("reactive_trace")
+if os.environ.get("REACTIVE_TRACE"):
+    logging.basicConfig()
+    logger.setLevel(logging.INFO)
+
+
+def _session_id() -> str:
+    session = get_current_session()
+    return session.id[:8] if session is not None else "-"
+
+
+def traced(layer: str):
+    # logs every recomputation of a reactive layer, with its duration
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not logger.isEnabledFor(logging.INFO):
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                logger.info("[%s] recomputed %s in %.1f ms", _session_id(), layer,
+                            (time.perf_counter() - start) * 1000)
+        return wrapper
+    return decorator
+
+
+def trace_inputs(input, names: list):
+    # one log line per input event, so the recomputations after it can be
+    # read as its consequences
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    for name in names:
+        def log_input(name=name):
+            @reactive.Effect(priority=100)
+            def _():
+                logger.info("[%s] input %s = %r", _session_id(), name,
+                            input[name]())
+        log_input()
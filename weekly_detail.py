@@ -0,0 +1,81 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+import dataset_store
+import endpoints
+
+SEXES = ["Male", "Female"]
+COLUMNS_PER_PREFECTURE = 20
+DEFAULT_AGE_GROUPS = {
+    "19歳以下": ["Under 10", "10s"],
+    "20~59歳": ["20s", "30s", "40s", "50s"],
+    "60歳以上": ["60s", "70s", "80s", "Over 90"],
+}
+
+
+class WeeklyCube:
+    # counts is a masked (week, prefecture, sex, age band) array, suppressed
+    # "*" cells are masked
+    def __init__(self, week_start: pd.DatetimeIndex, week_end: pd.DatetimeIndex,
+                 age_bands: list, counts: np.ma.MaskedArray):
+        self.week_start = week_start
+        self.week_end = week_end
+        self.age_bands = age_bands
+        self.counts = counts
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "WeeklyCube":
+        # df is the weekly detail file parsed with its schema: indexed by the
+        # week start, "*" cells NaN
+        values = df.to_numpy(dtype=float)
+        n_weeks, n_columns = values.shape
+        n_prefs = n_columns // COLUMNS_PER_PREFECTURE
+
+        counts = np.ma.masked_invalid(values).reshape(
+            n_weeks, n_prefs, len(SEXES), COLUMNS_PER_PREFECTURE // len(SEXES))
+
+        # "Male Under 10" -> "Under 10", taken from the first prefecture only
+        # since pandas suffixes the repeated labels of the others
+        labels = df.columns[:COLUMNS_PER_PREFECTURE // len(SEXES)]
+        age_bands = [label.split(" ", 1)[1] for label in labels]
+
+        # weeks run Thursday to Wednesday
+        return cls(df.index, df.index + pd.Timedelta(days=6), age_bands, counts)
+
+    def pyramid(self, pref_n: int, week: int = -1):
+        # male and female counts per age band, NaN where suppressed
+        counts = self.counts[week, pref_n].filled(np.nan)
+        return counts[0], counts[1]
+
+    def age_group_stack(self, pref_n: int, groups: dict = None) -> pd.DataFrame:
+        groups = groups or DEFAULT_AGE_GROUPS
+        # suppressed cells count as zero in the sums
+        by_band = self.counts[:, pref_n].sum(axis=1).filled(0)
+        columns = {
+            group: by_band[:, [self.age_bands.index(b) for b in bands]].sum(axis=1)
+            for group, bands in groups.items()
+        }
+        return pd.DataFrame(columns)\
+            .assign(week_start=self.week_start, week_end=self.week_end)\
+            .melt(id_vars=["week_start", "week_end"],
+                  var_name="Group", value_name="N")
+
+
+_lock = threading.Lock()
+_cubes: dict = {}
+
+
+def get_cube(url: str = endpoints.NEWLY_CONFIRMED_DETAIL_WEEKLY) -> WeeklyCube:
+    store = dataset_store.store
+    version = store.version(url)
+    cached = _cubes.get(url)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    with _lock:
+        cached = _cubes.get(url)
+        if cached is None or cached[0] != store.version(url):
+            df = store.read(url)
+            cached = _cubes[url] = (store.version(url), WeeklyCube.from_frame(df))
+    return cached[1]